@@ -0,0 +1,76 @@
+import logging
+import os
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import OperationalError, DisconnectionError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from database.db_test.db import engine
+from .db_pool import POOL_SETTINGS, PoolMetrics
+
+logger = logging.getLogger("async-db")
+
+# Sync driver -> asyncio driver for the same database
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url: URL) -> URL:
+    """The async-driver equivalent of the sync engine's URL."""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_engine_for(url: URL) -> AsyncEngine:
+    if url.get_backend_name() == "sqlite":
+        return create_async_engine(url, pool_pre_ping=True)
+    return create_async_engine(url, **{
+        **POOL_SETTINGS,
+        "pool_size": int(os.getenv("ASYNC_DB_POOL_SIZE", str(POOL_SETTINGS["pool_size"]))),
+        "max_overflow": int(os.getenv("ASYNC_DB_MAX_OVERFLOW", str(POOL_SETTINGS["max_overflow"]))),
+    })
+
+
+# Same database as the sync engine (POSTGRES_URL or SQLITE_DB_PATH), or ASYNC_DATABASE_URL if set.
+# Needs asyncpg (Postgres) or aiosqlite (SQLite); without them async routes answer 503.
+async_engine: Optional[AsyncEngine] = None
+try:
+    async_engine = create_engine_for(
+        make_url(os.getenv("ASYNC_DATABASE_URL")) if os.getenv("ASYNC_DATABASE_URL") else async_url(engine.url)
+    )
+except Exception as e:
+    logger.error(f"Async database engine unavailable: {e}")
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False) if async_engine else None
+async_pool_metrics = PoolMetrics("async")
+if async_engine is not None:
+    async_pool_metrics.attach(async_engine.sync_engine)
+
+
+async def get_async_database() -> AsyncIterator[AsyncSession]:
+    """Async counterpart of get_database for async routes"""
+    if AsyncSessionLocal is None:
+        raise HTTPException(status_code=503, detail="Async database driver not installed")
+    async with AsyncSessionLocal() as db:
+        try:
+            with async_pool_metrics.timed_checkout():
+                await db.connection()
+            yield db
+        except (OperationalError, DisconnectionError) as e:
+            logger.warning(f"Database connection issue in get_async_database: {e}")
+            await db.rollback()
+            raise
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def dispose_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
@@ -0,0 +1,134 @@
+"""
+Memory and time of list/aggregate queries: full Call rows vs column projections.
+
+Seeds a throwaway SQLite database with calls carrying long transcripts and
+eval JSON, then runs the call history and dashboard queries both ways and
+reports, per request, the peak Python memory (tracemalloc), query time and
+JSON serialization time:
+
+    python -m backend.benchmarks.bench_call_lists --calls 2000 --transcript-kb 20
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.db_test.db import Base
+from database.db_test import models
+
+from backend.call_queries import has_entity, select_call_rows
+
+HISTORY_FIELDS = ["call_id", "name", "call_started_at", "call_ended_at", "call_recording_url",
+                  "call_type", "call_status", "call_from", "call_to", "call_duration"]
+
+
+def seed(Session, calls: int, transcript_kb: int):
+    words = ["booking", "flight", "tomorrow", "window", "seat", "confirm", "payment", "refund"]
+    transcript = " ".join(random.choice(words) for _ in range(transcript_kb * 1024 // 7))
+    now = datetime.now()
+    db = Session()
+    db.bulk_insert_mappings(models.Call, [
+        {
+            "user_id": 1,
+            "call_id": f"bench-{i}",
+            "name": "Bench User",
+            "call_to": "+10000000000",
+            "call_from": "+12512202179",
+            "call_type": "Outbound",
+            "model_id": "bench-model",
+            "call_transcription": transcript,
+            "call_summary": transcript[: len(transcript) // 10],
+            "call_entity": {"Number of Seats": "2", "Travel Date": "15 August"} if i % 3 else {},
+            "call_conversation_quality": {"score": 7, "notes": transcript[:2000]},
+            "call_recording_url": f"https://example.invalid/api/stream/bench-{i}",
+            "call_duration": random.randint(10, 600),
+            "call_status": "ended",
+            "call_started_at": now - timedelta(minutes=i),
+            "call_ended_at": now - timedelta(minutes=i) + timedelta(seconds=90),
+        }
+        for i in range(calls)
+    ])
+    db.commit()
+    db.close()
+
+
+def measure(fn: Callable[[], List[Dict]], repeat: int) -> Dict[str, float]:
+    peaks, query_times, serialize_times, sizes = [], [], [], []
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows = fn()
+        query_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        body = json.dumps(rows, default=str)
+        serialize_times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        sizes.append(len(body))
+    return {
+        "peak_mem_mb": round(statistics.median(peaks) / 1e6, 2),
+        "query_ms": round(statistics.median(query_times) * 1000, 1),
+        "serialize_ms": round(statistics.median(serialize_times) * 1000, 1),
+        "response_kb": round(statistics.median(sizes) / 1024, 1),
+    }
+
+
+def main(args):
+    tmpdir = tempfile.mkdtemp(prefix="bench_call_lists_")
+    engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    seed(Session, args.calls, args.transcript_kb)
+    since = datetime.now() - timedelta(days=7)
+
+    def history_full():
+        with Session() as db:
+            calls = db.query(models.Call).filter(models.Call.user_id == 1).all()
+            return [{field: getattr(call, field) for field in HISTORY_FIELDS} for call in calls]
+
+    def history_projected():
+        with Session() as db:
+            calls = db.execute(select_call_rows().where(models.Call.user_id == 1)).all()
+            return [{field: getattr(call, field) for field in HISTORY_FIELDS} for call in calls]
+
+    def dashboard_full():
+        with Session() as db:
+            calls = db.query(models.Call).filter(models.Call.user_id == 1, models.Call.call_started_at >= since).all()
+            return [{"leads": sum(1 for c in calls if c.call_entity and c.call_entity != {}), "calls": len(calls)}]
+
+    def dashboard_projected():
+        with Session() as db:
+            calls = db.query(models.Call.call_started_at, models.Call.call_duration, has_entity()).filter(
+                models.Call.user_id == 1, models.Call.call_started_at >= since
+            ).all()
+            return [{"leads": sum(1 for c in calls if c.has_entity), "calls": len(calls)}]
+
+    results = []
+    for name, fn in [("history_full", history_full), ("history_projected", history_projected),
+                     ("dashboard_full", dashboard_full), ("dashboard_projected", dashboard_projected)]:
+        result = {"target": name, "calls": args.calls, "transcript_kb": args.transcript_kb, **measure(fn, args.repeat)}
+        results.append(result)
+        print(json.dumps(result))
+
+    engine.dispose()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark full-row vs projected call list queries")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--transcript-kb", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    main(parser.parse_args())
@@ -0,0 +1,102 @@
+"""
+Dispatch latency and throughput: native LiveKitAPI client vs the lk CLI subprocess.
+
+Creates real agent dispatches against LIVEKIT_URL, so use an agent name with no
+registered worker (the dispatch is accepted but never picked up) and let the
+script delete the rooms afterwards:
+
+    python -m backend.benchmarks.bench_dispatch --agent-name bench-noop \\
+        --requests 100 --concurrency 1,8,32 --modes native,cli
+
+For each mode and concurrency it reports p50/p95/p99 dispatch latency and the
+achieved dispatches/sec; the highest of those is the max dispatch rate.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from livekit import api
+
+from backend.benchmarks.bench_openai_eval import percentile
+from backend.livekit_dispatch import LiveKitDispatcher, cli_dispatch
+
+
+async def run_mode(mode: str, dispatcher: LiveKitDispatcher, args, concurrency: int, rooms: List[str]) -> Dict[str, object]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = args.requests
+
+    async def one():
+        metadata = {"name": "bench", "phone": args.contact_number, "agent_name": args.agent_name}
+        if mode == "native":
+            return await dispatcher.dispatch(agent_name=args.agent_name, metadata=metadata)
+        return await cli_dispatch(agent_name=args.agent_name, metadata=metadata, contact_number=args.contact_number)
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            result = await one()
+            latencies.append(time.perf_counter() - start)
+            if result.success and result.room_id:
+                rooms.append(result.room_id)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "errors": errors,
+        "dispatches_per_sec": round(args.requests / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def main(args):
+    dispatcher = LiveKitDispatcher(room_prefix="bench-")
+    await dispatcher.start()
+    rooms: List[str] = []
+    results = []
+    try:
+        for mode in args.modes.split(","):
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                result = await run_mode(mode, dispatcher, args, concurrency, rooms)
+                results.append(result)
+                print(json.dumps(result))
+    finally:
+        if not args.keep_rooms:
+            for room in rooms:
+                try:
+                    await dispatcher.client.room.delete_room(api.DeleteRoomRequest(room=room))
+                except Exception:
+                    pass
+        await dispatcher.close()
+
+    for mode in args.modes.split(","):
+        best = max((r["dispatches_per_sec"] for r in results if r["mode"] == mode), default=0)
+        print(json.dumps({"mode": mode, "max_dispatches_per_sec": best}))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LiveKit agent dispatch paths")
+    parser.add_argument("--agent-name", default="bench-noop")
+    parser.add_argument("--contact-number", default="+10000000000")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels")
+    parser.add_argument("--modes", default="native,cli", help="Comma separated: native, cli")
+    parser.add_argument("--keep-rooms", action="store_true")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,215 @@
+"""
+Latency/throughput benchmark for the eval path.
+
+Drives call_summary, extract_entities_from_transcript, conversation_eval and
+(over HTTP) the call details stream at a fixed concurrency and reports
+p50/p95/p99 latency, throughput, and how long the event loop was blocked while
+doing it. The OpenAI SDK's own retries are off (--sdk-retries), so 429s from the
+fake server show up in the numbers instead of being retried out of sight.
+
+Run the fake server first (see fake_openai.py), then:
+
+    OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=fake \\
+        python -m backend.benchmarks.bench_openai_eval --concurrency 16 --requests 200
+
+The call_details target reads /api/call_details_stream to the end. It needs a
+running backend with CALL_DETAILS_EVALUATION=true (otherwise only the
+placeholder is served) and an existing call:
+
+    python -m backend.benchmarks.bench_openai_eval --target call_details \\
+        --backend-url http://localhost:1234 --client sbi --user-id 1 --call-id <room>
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List
+
+os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:8900/v1")
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+SAMPLE_TRANSCRIPT = """Agent: Hello, thank you for calling. How can I help you with your booking today?
+User: Hi, I want to book flight tickets from Mumbai to Dubai.
+Agent: Sure. How many tickets would you like to book?
+User: two tickets please, one way.
+Agent: Which date are you looking to travel?
+User: on 15th August, morning flight if possible.
+Agent: Any meal or seat preference?
+User: vegetarian meal and a window seat.
+Agent: The total fare comes to 42,000 rupees. Shall I proceed?
+User: yes, please go ahead."""
+
+CALL_DETAILS_PLACEHOLDER = "Waiting for Transcription to be available. Please try again after the call is over."
+
+SAMPLE_FIELDS = [
+    ("Starting from", "Where is the user boarding the flight from?"),
+    ("Going To", "Destination of the user?"),
+    ("Number of Seats", "What is the total number of tickets the user wants to book?"),
+    ("Meal Preferences", "What is users meal preference?"),
+    ("Seat Preference", "What is the Users seat preference?"),
+    ("Round Trip or One Way", "Is the user looking for a round trip or one way ticket?"),
+    ("Travel Date", "Which date is the user looking to travel?"),
+    ("Flight Details", "What are the flight details the user is looking for? (e.g. flight number, timings, etc.)"),
+    ("Total Fare", "What is the total fare for the tickets?"),
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class LoopLagMonitor:
+    """Measures how long the event loop is blocked by sleeping in short ticks."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if lag > 0:
+                self.blocked += lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def run_load(name: str, fn: Callable[[], Awaitable[object]], requests: int, concurrency: int) -> Dict[str, object]:
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                result = await fn()
+                if isinstance(result, dict) and ("error" in result or result.get("status_code", 200) != 200):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    await monitor.stop()
+
+    return {
+        "target": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "loop_blocked_s": round(monitor.blocked, 3),
+        "loop_blocked_pct": round(monitor.blocked / wall * 100, 1) if wall else 0.0,
+        "max_loop_lag_ms": round(monitor.max_lag * 1000, 1),
+    }
+
+
+def disable_sdk_retries(max_retries: int):
+    """Make every OpenAI client openai_eval creates use `max_retries`."""
+    import functools
+    from backend import openai_eval
+
+    openai_eval.OpenAI = functools.partial(openai_eval.OpenAI, max_retries=max_retries)
+    openai_eval.client = openai_eval.client.with_options(max_retries=max_retries)
+
+
+def build_targets(args) -> Dict[str, Callable[[], Awaitable[object]]]:
+    disable_sdk_retries(args.sdk_retries)
+    from backend.openai_eval import call_summary, extract_entities_from_transcript, conversation_eval
+
+    targets = {
+        "call_summary": lambda: call_summary(SAMPLE_TRANSCRIPT),
+        "extract_entities": lambda: extract_entities_from_transcript(SAMPLE_TRANSCRIPT, SAMPLE_FIELDS),
+        "conversation_eval": lambda: conversation_eval(SAMPLE_TRANSCRIPT),
+    }
+
+    if args.call_id:
+        import httpx
+
+        http = httpx.AsyncClient(base_url=args.backend_url, timeout=args.timeout)
+        url = f"/api/call_details_stream/{args.client}/{args.user_id}/{args.call_id}"
+
+        async def call_details():
+            details = {}
+            async with http.stream("GET", url, params={"format": "ndjson"}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        message = json.loads(line)
+                        details.setdefault(message["event"], message["data"])
+            if details.get("transcription") == CALL_DETAILS_PLACEHOLDER:
+                raise SystemExit("The backend serves the call details placeholder; start it with CALL_DETAILS_EVALUATION=true")
+            # An "error" event marks the request as failed in run_load
+            return details
+
+        targets["call_details"] = call_details
+    return targets
+
+
+async def main(args):
+    targets = build_targets(args)
+    selected = list(targets) if args.target == "all" else [args.target]
+    missing = [name for name in selected if name not in targets]
+    if missing:
+        raise SystemExit(f"Target(s) {missing} need --call-id (and a running backend)")
+
+    results = []
+    for name in selected:
+        result = await run_load(name, targets[name], args.requests, args.concurrency)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the openai_eval path")
+    parser.add_argument("--target", default="all",
+                        choices=["all", "call_summary", "extract_entities", "conversation_eval", "call_details"])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--backend-url", default="http://127.0.0.1:1234")
+    parser.add_argument("--client", default="sbi")
+    parser.add_argument("--user-id", default="1")
+    parser.add_argument("--call-id", default=None)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--sdk-retries", type=int, default=0, help="max_retries of the OpenAI clients")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,134 @@
+"""
+Serialize + compress cost of representative API payloads.
+
+Builds call history, call details (long transcript) and dashboard payloads,
+then for each one reports the time to serialize with the stdlib encoder (what
+JSONResponse did) and with orjson, and the time and bytes on the wire for
+identity, gzip and brotli encodings:
+
+    python -m backend.benchmarks.bench_responses --calls 500 --transcript-kb 20
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict
+
+from backend.compression import brotli, compress_bytes
+from backend.responses import dumps
+
+
+def history_payload(calls: int) -> list:
+    now = datetime.now()
+    return [
+        {
+            "Name": {"name": "Bench User"},
+            "Start_time": now - timedelta(minutes=i),
+            "End_time": now - timedelta(minutes=i) + timedelta(seconds=90),
+            "recording_api": f"https://example.invalid/api/stream/bench-{i}",
+            "call_details": f"https://example.invalid/api/call_details/BENCH/1/bench-{i}",
+            "call_type": "Outbound",
+            "call_status": random.choice(["ended", "Not picked", "Call rejected"]),
+            "from_number": "+12512202179",
+            "to_number": "+10000000000",
+            "direction": "Outbound",
+            "duration_ms": random.randint(10_000, 600_000),
+        }
+        for i in range(calls)
+    ]
+
+
+def details_payload(transcript_kb: int) -> dict:
+    words = ["booking", "flight", "tomorrow", "window", "seat", "confirm", "payment", "refund"]
+    lines = []
+    while sum(len(line) for line in lines) < transcript_kb * 1024:
+        speaker = random.choice(["agent", "user"])
+        lines.append(f"{speaker}: " + " ".join(random.choice(words) for _ in range(random.randint(4, 20))))
+    return {
+        "transcription": "\n".join(lines),
+        "entity": {"Number of Seats": {"value": "2", "confidence": 0.93}, "Travel Date": "15 August"},
+        "conversation_eval": {"score": 7, "notes": " ".join(lines[:20])},
+        "summary": " ".join(lines[:10]),
+    }
+
+
+def dashboard_payload(days: int) -> dict:
+    today = datetime.now().date()
+    return {
+        "daily": [
+            {"date": today - timedelta(days=d), "calls": random.randint(0, 500),
+             "leads": random.randint(0, 50), "avg_duration": random.random() * 300}
+            for d in range(days)
+        ],
+        "totals": {"calls": 12345, "leads": 678, "success_rate": 0.42},
+    }
+
+
+def stdlib_dumps(content: Any) -> bytes:
+    """What JSONResponse rendered after jsonable_encoder turned datetimes into isoformat strings."""
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"),
+                      default=lambda v: v.isoformat()).encode("utf-8")
+
+
+def timed(fn: Callable[[], Any], repeat: int):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, round(statistics.median(times) * 1000, 3)
+
+
+def measure(name: str, payload: Any, args) -> Dict[str, Any]:
+    stdlib_body, stdlib_ms = timed(lambda: stdlib_dumps(payload), args.repeat)
+    body, orjson_ms = timed(lambda: dumps(payload), args.repeat)
+    assert json.loads(body) == json.loads(stdlib_body), f"{name}: orjson output differs from stdlib"
+
+    result = {
+        "payload": name,
+        "stdlib_serialize_ms": stdlib_ms,
+        "orjson_serialize_ms": orjson_ms,
+        "identity_bytes": len(body),
+    }
+    encodings = [("gzip", args.gzip_level)] + ([("br", args.brotli_quality)] if brotli is not None else [])
+    for encoding, level in encodings:
+        compressed, compress_ms = timed(
+            lambda: compress_bytes(body, encoding, gzip_level=level, brotli_quality=level), args.repeat
+        )
+        result[f"{encoding}_compress_ms"] = compress_ms
+        result[f"{encoding}_bytes"] = len(compressed)
+        result[f"{encoding}_ratio"] = round(len(body) / len(compressed), 1)
+    return result
+
+
+def main(args):
+    payloads = [
+        ("call_history", history_payload(args.calls)),
+        ("call_details", details_payload(args.transcript_kb)),
+        ("dashboard", dashboard_payload(args.days)),
+    ]
+    if brotli is None:
+        print("brotli is not installed, skipping br")
+    results = []
+    for name, payload in payloads:
+        result = measure(name, payload, args)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JSON serialization and response compression")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--transcript-kb", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--gzip-level", type=int, default=6)
+    parser.add_argument("--brotli-quality", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    main(parser.parse_args())
@@ -0,0 +1,151 @@
+"""
+Offline stand-in for the OpenAI chat completions API.
+
+Serves POST /v1/chat/completions with configurable latency, error rate and
+canned JSON, so the eval path can be measured without paying OpenAI or riding
+its latency variance. Point the backend at it with:
+
+    python -m backend.benchmarks.fake_openai --port 8900 --latency lognormal:0.8,0.5 --error-rate 0.02
+    export OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=fake
+
+Latency specs: constant:S, uniform:LOW,HIGH, normal:MEAN,STD, lognormal:MEDIAN,SIGMA (seconds).
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+FIELD_RE = re.compile(r'^\s*"([^"]+)"\s*:\s*\{\s*"text"', re.MULTILINE)
+
+EVAL_ATTRIBUTES = ["clarity", "fluency", "coherence", "engagement", "vocabulary", "listening"]
+
+CANNED_SUMMARY = (
+    "The user called to book a one way flight from Mumbai to Dubai for two passengers "
+    "on the 15th of August. The agent confirmed seat and meal preferences, shared the "
+    "available flight timings and the total fare, and the user agreed to proceed."
+)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Build a latency sampler (seconds) from a spec such as "lognormal:0.8,0.5"."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "constant":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def canned_content(messages: List[Dict[str, Any]], response_format: Dict[str, Any] = None) -> str:
+    """Pick a plausible response for the eval prompt that was sent."""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+
+    fields = []
+    if response_format and response_format.get("type") == "json_schema":
+        schema = response_format.get("json_schema", {}).get("schema", {})
+        fields = list(schema.get("properties", {}).keys())
+    if not fields:
+        fields = FIELD_RE.findall(prompt)
+
+    if '"clarity"' in prompt or "clarity" in fields:
+        result = {
+            attr: {"score": random.randint(1, 5), "feedback": f"Canned {attr} feedback."}
+            for attr in EVAL_ATTRIBUTES
+        }
+        result["summary"] = "The user participated actively and answered every question."
+        result["tip"] = "Give specific numbers when asked about salary and notice period."
+        return json.dumps(result)
+
+    if fields:
+        return json.dumps({
+            field: {"text": f"canned text for {field}", "value": f"canned {field}", "confidence": "high"}
+            for field in fields
+        })
+
+    return CANNED_SUMMARY
+
+
+def create_app(latency: Callable[[], float], error_rate: float = 0.0, wrap_json_fences: bool = False) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    app.state.requests = 0
+    app.state.errors = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        await asyncio.sleep(latency())
+
+        if random.random() < error_rate:
+            app.state.errors += 1
+            status = random.choice([429, 500, 503])
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "fake_error", "code": status}},
+                status_code=status,
+                headers={"retry-after": "1"} if status == 429 else None,
+            )
+
+        messages = body.get("messages", [])
+        content = canned_content(messages, body.get("response_format"))
+        if wrap_json_fences and content.startswith("{"):
+            content = f"```json\n{content}\n```"
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests, "errors": app.state.errors}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5", help="Latency distribution spec in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with 429/5xx")
+    parser.add_argument("--json-fences", action="store_true", help="Wrap JSON replies in ```json fences")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    uvicorn.run(
+        create_app(parse_latency(args.latency), args.error_rate, args.json_fences),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
@@ -0,0 +1,288 @@
+"""
+Cold archival of old calls.
+
+Calls older than CALL_ARCHIVE_AFTER_DAYS are moved out of the hot `calls`
+table into compressed monthly segment files (gzip JSONL, or Parquet when
+CALL_ARCHIVE_FORMAT=parquet and pyarrow is installed), transcripts and eval
+JSON included. `archived_calls` keeps the listing columns and the segment
+each call lives in, so history can list archived calls without opening
+segments and details can load one call on demand.
+
+    python -m backend.call_archive --older-than-days 90
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, Index, delete, insert, select
+from sqlalchemy.orm import Session
+
+from database.db_test.db import Base, SessionLocal, engine
+from database.db_test import models
+
+logger = logging.getLogger("call-archive")
+
+CALL_ARCHIVE_DIR = os.getenv("CALL_ARCHIVE_DIR", "./backend/archive")
+CALL_ARCHIVE_FORMAT = os.getenv("CALL_ARCHIVE_FORMAT", "jsonl")  # jsonl or parquet
+CALL_ARCHIVE_AFTER_DAYS = int(os.getenv("CALL_ARCHIVE_AFTER_DAYS", "90"))
+CALL_ARCHIVE_BATCH_SIZE = int(os.getenv("CALL_ARCHIVE_BATCH_SIZE", "5000"))
+
+CALL_COLUMNS = models.Call.__table__.columns
+DATETIME_COLUMNS = {c.name for c in CALL_COLUMNS if isinstance(c.type, DateTime)}
+
+
+class ArchivedCall(Base):
+    """Index of archived calls: listing columns plus the segment holding the full row."""
+    __tablename__ = "archived_calls"
+
+    id = Column(Integer, primary_key=True)
+    call_id = Column(String, nullable=False, unique=True)
+    user_id = Column(Integer, nullable=False)
+    model_id = Column(String, nullable=True)
+    name = Column(String, nullable=True)
+    call_to = Column(String, nullable=True)
+    call_from = Column(String, nullable=True)
+    call_type = Column(String, nullable=True)
+    call_status = Column(String, nullable=True)
+    call_duration = Column(Integer, nullable=True)
+    call_started_at = Column(DateTime, nullable=True)
+    call_ended_at = Column(DateTime, nullable=True)
+    call_recording_url = Column(String, nullable=True)
+    segment = Column(String, nullable=False)
+    archived_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (Index("ix_archived_calls_user_id_call_started_at", "user_id", "call_started_at"),)
+
+
+def select_archived_call_rows():
+    """select_call_rows() for archived calls: the same columns, in the same order, from the index."""
+    return select(
+        ArchivedCall.id, ArchivedCall.call_id, ArchivedCall.user_id, ArchivedCall.model_id,
+        ArchivedCall.name, ArchivedCall.call_to, ArchivedCall.call_from, ArchivedCall.call_type,
+        ArchivedCall.call_status, ArchivedCall.call_duration, ArchivedCall.call_started_at,
+        ArchivedCall.call_ended_at, ArchivedCall.call_recording_url,
+    )
+
+
+class ArchivedCallRecord:
+    """Read-only stand-in for a models.Call row loaded from a segment."""
+
+    archived = True
+
+    def __init__(self, row: Dict[str, Any]):
+        for column in CALL_COLUMNS:
+            value = row.get(column.name)
+            if column.name in DATETIME_COLUMNS and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            setattr(self, column.name, value)
+
+
+def _serialize(call) -> Dict[str, Any]:
+    row = {}
+    for column in CALL_COLUMNS:
+        value = getattr(call, column.name)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        row[column.name] = value
+    return row
+
+
+def _write_segment(month: str, rows: List[Dict[str, Any]]) -> str:
+    directory = os.path.join(CALL_ARCHIVE_DIR, month)
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+    if CALL_ARCHIVE_FORMAT == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            logger.error("pyarrow is not installed, writing JSONL segments instead")
+        else:
+            path = os.path.join(directory, f"calls-{month}-{stamp}.parquet")
+            # JSON columns are stored as strings so every segment has a flat schema
+            flat = [
+                {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in row.items()}
+                for row in rows
+            ]
+            pq.write_table(pa.Table.from_pylist(flat), path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+            return path
+
+    path = os.path.join(directory, f"calls-{month}-{stamp}.jsonl.gz")
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+@lru_cache(maxsize=int(os.getenv("CALL_ARCHIVE_SEGMENT_CACHE", "8")))
+def _load_jsonl_segment(path: str) -> Dict[str, Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        rows = (json.loads(line) for line in f if line.strip())
+        return {row["call_id"]: row for row in rows}
+
+
+def _decode_parquet_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    for name, value in row.items():
+        if isinstance(value, str) and value[:1] in "{[":
+            try:
+                row[name] = json.loads(value)
+            except json.JSONDecodeError:
+                pass
+    return row
+
+
+def read_archived_row(segment: str, call_id: str) -> Optional[Dict[str, Any]]:
+    if segment.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        rows = pq.read_table(segment, filters=[("call_id", "=", call_id)]).to_pylist()
+        return _decode_parquet_row(rows[0]) if rows else None
+    return _load_jsonl_segment(segment).get(call_id)
+
+
+def read_segment(segment: str) -> Dict[str, Dict[str, Any]]:
+    """Every row of a segment by call_id, for reading many calls of one segment."""
+    if segment.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return {row["call_id"]: _decode_parquet_row(row) for row in pq.read_table(segment).to_pylist()}
+    return _load_jsonl_segment(segment)
+
+
+async def load_archived_call(db, call_id: str, user_id=None, client: Optional[str] = None) -> Optional[ArchivedCallRecord]:
+    """
+    Full archived call for `call_id` (AsyncSession), optionally restricted to a
+    user and client like the hot-table lookups. None if it is not archived.
+    """
+    query = select(ArchivedCall).where(ArchivedCall.call_id == call_id)
+    if user_id is not None:
+        query = query.where(ArchivedCall.user_id == int(user_id))
+    if client is not None:
+        query = query.join(models.Model, models.Model.model_id == ArchivedCall.model_id).where(
+            models.Model.client_name == client.upper()
+        )
+    entry = (await db.execute(query)).scalars().first()
+    if entry is None:
+        return None
+    row = await asyncio.to_thread(read_archived_row, entry.segment, call_id)
+    if row is None:
+        logger.error(f"Call {call_id} is indexed in {entry.segment} but missing from it")
+        return None
+    return ArchivedCallRecord(row)
+
+
+def archive_calls(db: Session, older_than_days: int = CALL_ARCHIVE_AFTER_DAYS,
+                  batch_size: int = CALL_ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move one batch of calls started before the cutoff into segments.
+    Returns the number of calls archived; call repeatedly until it returns 0.
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    calls = (
+        db.query(models.Call)
+        .filter(models.Call.call_started_at < cutoff)
+        .order_by(models.Call.call_started_at)
+        .limit(batch_size)
+        .all()
+    )
+    if not calls:
+        return 0
+
+    by_month: Dict[str, List[Any]] = defaultdict(list)
+    for call in calls:
+        by_month[call.call_started_at.strftime("%Y-%m")].append(call)
+
+    index_rows = []
+    for month, month_calls in by_month.items():
+        # The segment is fully written before any row leaves the hot table
+        segment = _write_segment(month, [_serialize(call) for call in month_calls])
+        for call in month_calls:
+            index_rows.append({
+                "call_id": call.call_id,
+                "user_id": call.user_id,
+                "model_id": call.model_id,
+                "name": call.name,
+                "call_to": call.call_to,
+                "call_from": call.call_from,
+                "call_type": call.call_type,
+                "call_status": call.call_status,
+                "call_duration": call.call_duration,
+                "call_started_at": call.call_started_at,
+                "call_ended_at": call.call_ended_at,
+                "call_recording_url": call.call_recording_url,
+                "segment": segment,
+                "archived_at": datetime.now(),
+            })
+
+    try:
+        db.execute(insert(ArchivedCall), index_rows)
+        db.execute(delete(models.Call).where(models.Call.id.in_([call.id for call in calls])))
+        db.commit()
+    except Exception:
+        # Segments without index rows are never read; the next run rewrites these calls
+        db.rollback()
+        raise
+    logger.info(f"Archived {len(calls)} calls into {len(by_month)} segment(s)")
+    return len(calls)
+
+
+def archive_all(older_than_days: int = CALL_ARCHIVE_AFTER_DAYS, batch_size: int = CALL_ARCHIVE_BATCH_SIZE) -> int:
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            archived = archive_calls(db, older_than_days, batch_size)
+            total += archived
+            if archived < batch_size:
+                return total
+    finally:
+        db.close()
+
+
+class CallArchiver:
+    """Runs archive_all periodically in a worker thread."""
+
+    def __init__(self, interval: float = 3600.0):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Optional[float] = None
+        self.last_archived = 0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_archived = await asyncio.to_thread(archive_all)
+                self.last_run = time.time()
+            except Exception as e:
+                logger.error(f"Call archival failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old calls into compressed segments")
+    parser.add_argument("--older-than-days", type=int, default=CALL_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=CALL_ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    print(f"Archived {archive_all(args.older_than_days, args.batch_size)} calls")
@@ -0,0 +1,186 @@
+import csv
+import io
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from database.db_test import models
+from .call_archive import ArchivedCall, ArchivedCallRecord, read_segment
+from .extractor_config import extractors
+
+logger = logging.getLogger("call-export")
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+CALL_EXPORT_COLUMNS = (
+    models.Call.call_id,
+    models.Call.user_id,
+    models.Call.name,
+    models.Call.call_to,
+    models.Call.call_from,
+    models.Call.call_type,
+    models.Call.call_status,
+    models.Call.call_duration,
+    models.Call.call_started_at,
+    models.Call.call_ended_at,
+    models.Call.model_id,
+)
+
+
+def entity_fields(client: str) -> List[str]:
+    """Entity fields configured for the client, in extractor order."""
+    return [field for field, _ in (extractors.get(client, {}).get("entities") or [])]
+
+
+def export_columns(client: str) -> List[str]:
+    columns = [column.key for column in CALL_EXPORT_COLUMNS]
+    for field in entity_fields(client):
+        columns += [field, f"{field}_confidence"]
+    return columns
+
+
+def flatten_entities(entity: Any, fields: List[str]) -> Dict[str, Any]:
+    """
+    One value (and confidence, when the extractor gave one) per configured field.
+    Values are either plain or {"text", "value", "confidence"} dicts.
+    """
+    flat = {}
+    entity = entity if isinstance(entity, dict) else {}
+    for field in fields:
+        value = entity.get(field)
+        confidence = None
+        if isinstance(value, dict):
+            confidence = value.get("confidence")
+            value = value.get("value", value.get("text"))
+        flat[field] = value
+        flat[f"{field}_confidence"] = confidence
+    return flat
+
+
+def iter_export_rows(db, client: str, start: datetime, end: datetime,
+                     user_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Calls of `client` started in [start, end), oldest first, read through a
+    server-side cursor `batch_size` rows at a time. Archived calls are older
+    than every hot call, so they come first, read from their segments.
+    """
+    fields = entity_fields(client)
+    yield from iter_archived_export_rows(db, client, start, end, fields, user_id, batch_size)
+
+    query = (
+        select(*CALL_EXPORT_COLUMNS, models.Call.call_entity)
+        .join(models.Model, models.Model.model_id == models.Call.model_id)
+        .where(
+            models.Model.client_name == client.upper(),
+            models.Call.call_started_at >= start,
+            models.Call.call_started_at < end,
+        )
+        .order_by(models.Call.call_started_at)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    if user_id is not None:
+        query = query.where(models.Call.user_id == user_id)
+
+    for row in db.execute(query):
+        record = {column.key: getattr(row, column.key) for column in CALL_EXPORT_COLUMNS}
+        record.update(flatten_entities(row.call_entity, fields))
+        yield record
+
+
+def iter_archived_export_rows(db, client: str, start: datetime, end: datetime, fields: List[str],
+                              user_id: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """Archived calls of iter_export_rows, each segment read once while its calls are exported."""
+    query = (
+        select(ArchivedCall.call_id, ArchivedCall.segment)
+        .join(models.Model, models.Model.model_id == ArchivedCall.model_id)
+        .where(
+            models.Model.client_name == client.upper(),
+            ArchivedCall.call_started_at >= start,
+            ArchivedCall.call_started_at < end,
+        )
+        .order_by(ArchivedCall.call_started_at)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    if user_id is not None:
+        query = query.where(ArchivedCall.user_id == user_id)
+
+    segment, rows = None, {}
+    for entry in db.execute(query):
+        if entry.segment != segment:
+            segment, rows = entry.segment, read_segment(entry.segment)
+        row = rows.get(entry.call_id)
+        if row is None:
+            logger.error(f"Call {entry.call_id} is indexed in {entry.segment} but missing from it")
+            continue
+        call = ArchivedCallRecord(row)
+        record = {column.key: getattr(call, column.key) for column in CALL_EXPORT_COLUMNS}
+        record.update(flatten_entities(call.call_entity, fields))
+        yield record
+
+
+def stream_csv(rows: Iterator[Dict[str, Any]], columns: List[str], flush_every: int = 500) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands its bytes back to the caller, for streaming Parquet."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_parquet(rows: Iterator[Dict[str, Any]], columns: List[str], row_group_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Parquet file streamed one row group at a time; every column is written as a string."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def write(batch: List[Dict[str, Any]]):
+        writer.write_table(pa.Table.from_pylist(
+            [{c: None if row.get(c) is None else str(row.get(c)) for c in columns} for row in batch],
+            schema=schema,
+        ))
+
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= row_group_size:
+            write(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write(batch)
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,54 @@
+"""
+Lightweight projections of models.Call for list and aggregate views.
+
+A full Call row drags along the transcript and the summary/entity/eval JSON,
+which list and dashboard views never use. These helpers select just the
+listing columns (as row tuples with attribute access), or defer the heavy
+columns when an ORM object is needed for an update.
+"""
+from sqlalchemy import String, and_, cast, not_, select
+from sqlalchemy.orm import defer
+
+from database.db_test import models
+
+HEAVY_CALL_COLUMNS = (
+    models.Call.call_transcription,
+    models.Call.call_summary,
+    models.Call.call_entity,
+    models.Call.call_conversation_quality,
+)
+
+# Everything call history renders
+CALL_LIST_COLUMNS = (
+    models.Call.id,
+    models.Call.call_id,
+    models.Call.user_id,
+    models.Call.model_id,
+    models.Call.name,
+    models.Call.call_to,
+    models.Call.call_from,
+    models.Call.call_type,
+    models.Call.call_status,
+    models.Call.call_duration,
+    models.Call.call_started_at,
+    models.Call.call_ended_at,
+    models.Call.call_recording_url,
+)
+
+
+def has_entity():
+    """SQL version of `call.call_entity and call.call_entity != {}`, labelled `has_entity`."""
+    return and_(
+        models.Call.call_entity.isnot(None),
+        not_(cast(models.Call.call_entity, String).in_(["{}", "null", "[]", '""'])),
+    ).label("has_entity")
+
+
+def select_call_rows(*extra_columns):
+    """SELECT of the call listing columns (plus `extra_columns`), rows as named tuples."""
+    return select(*CALL_LIST_COLUMNS, *extra_columns)
+
+
+def without_heavy_columns():
+    """Loader options for ORM queries that only touch light columns of Call."""
+    return [defer(column) for column in HEAVY_CALL_COLUMNS]
@@ -0,0 +1,356 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.db_test.db import Base, SessionLocal
+from database.db_test import models
+from .call_queries import without_heavy_columns
+from .dispatch_queue import LANE_CAMPAIGN, DispatchQueueFull
+
+logger = logging.getLogger("call-retries")
+
+# Outcomes reported by the agent, and the call_status each one leaves on the Call row
+OUTCOME_ANSWERED = "answered"
+OUTCOME_REJECTED = "rejected"
+OUTCOME_UNAVAILABLE = "unavailable"
+OUTCOME_NO_ANSWER = "no_answer"
+OUTCOME_CALL_STATUS = {
+    OUTCOME_ANSWERED: "Ongoing",
+    OUTCOME_REJECTED: "Call rejected",
+    OUTCOME_UNAVAILABLE: "User unavailable",
+    OUTCOME_NO_ANSWER: "Not picked",
+}
+
+# Backoff before each retry attempt, per outcome (seconds, attempt 1, 2, ...).
+# A rejected call waits longer than one that simply was not picked up.
+RETRY_BACKOFF_SECONDS: Dict[str, List[float]] = {
+    OUTCOME_NO_ANSWER: [300, 1800, 7200],
+    OUTCOME_UNAVAILABLE: [600, 3600, 14400],
+    OUTCOME_REJECTED: [3600, 14400],
+    **json.loads(os.getenv("CALL_RETRY_BACKOFF_SECONDS", "{}")),
+}
+CALL_RETRY_MAX_ATTEMPTS = int(os.getenv("CALL_RETRY_MAX_ATTEMPTS", "3"))
+CALL_RETRY_JITTER = float(os.getenv("CALL_RETRY_JITTER", "0.1"))
+# A retry still dispatching after this long was claimed by a worker that died; requeue it
+CALL_RETRY_CLAIM_TIMEOUT_SECONDS = float(os.getenv("CALL_RETRY_CLAIM_TIMEOUT_SECONDS", "300"))
+
+
+class CallRetry(Base):
+    """
+    One scheduled redial of an unanswered call.
+
+    `call_id` is the call that failed, `retry_call_id` the call created when the
+    retry is dispatched. Pending rows are scanned through the (status, due_at)
+    index, so the scheduler only ever touches rows that are due.
+    """
+    __tablename__ = "call_retries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    call_id = Column(String, index=True, nullable=False)
+    root_call_id = Column(String, index=True, nullable=False)  # first call of the retry chain
+    retry_call_id = Column(String, index=True, nullable=True)
+    attempt = Column(Integer, nullable=False)
+    outcome = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, dispatching, dispatched, failed
+    due_at = Column(DateTime, nullable=False)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    dispatched_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_call_retries_status_due_at", "status", "due_at"),)
+
+
+def retry_delay(outcome: str, attempt: int) -> Optional[float]:
+    """Seconds to wait before retry `attempt` (1-based), or None if no retry is due."""
+    backoff = RETRY_BACKOFF_SECONDS.get(outcome)
+    if not backoff or attempt > CALL_RETRY_MAX_ATTEMPTS:
+        return None
+    delay = backoff[min(attempt, len(backoff)) - 1]
+    return delay * (1 + random.uniform(-CALL_RETRY_JITTER, CALL_RETRY_JITTER))
+
+
+async def record_call_outcome(db: AsyncSession, call, outcome: str) -> Optional[CallRetry]:
+    """
+    Store the dial outcome on the Call row and, for unanswered calls, schedule
+    the next retry. Returns the scheduled retry, if any.
+    """
+    call.call_status = OUTCOME_CALL_STATUS[outcome]
+    if outcome == OUTCOME_ANSWERED:
+        await db.commit()
+        return None
+
+    # Only the latest call of a chain can schedule; repeated reports are no-ops
+    if (await db.execute(select(CallRetry.id).where(CallRetry.call_id == call.call_id))).first() is not None:
+        await db.commit()
+        return None
+
+    previous = (await db.execute(
+        select(CallRetry).where(CallRetry.retry_call_id == call.call_id)
+    )).scalars().first()
+    attempt = previous.attempt + 1 if previous else 1
+    delay = retry_delay(outcome, attempt)
+    if delay is None:
+        await db.commit()
+        logger.info(f"No retry for call {call.call_id} after {outcome} (attempt {attempt})")
+        return None
+
+    retry = CallRetry(
+        call_id=call.call_id,
+        root_call_id=previous.root_call_id if previous else call.call_id,
+        attempt=attempt,
+        outcome=outcome,
+        status="pending",
+        due_at=datetime.now() + timedelta(seconds=delay),
+    )
+    db.add(retry)
+    await db.commit()
+    logger.info(f"Scheduled retry {attempt} for call {call.call_id} after {outcome} in {delay:.0f}s")
+    return retry
+
+
+@dataclass
+class ClaimedRetry:
+    id: int
+    call_id: str
+    root_call_id: str
+    attempt: int
+
+
+@dataclass
+class RetryTarget:
+    """What a retry redials: the original call's contact and agent."""
+    user_id: int
+    name: Optional[str]
+    call_to: str
+    call_from: Optional[str]
+    call_type: Optional[str]
+    model_id: str
+    model_name: str
+
+
+class RetryScheduler:
+    """
+    Polls for due retries and redials them through the campaign lane of the
+    dispatch admission queue, so retries never crowd out interactive calls.
+
+    The database work is blocking and runs in worker threads, each step on a
+    short session of its own; no session is held while a retry waits for
+    admission or is being dialled.
+    """
+
+    def __init__(self, dispatcher, admission, trunk_id: str, base_url: str,
+                 batch_size: int = 100, poll_interval: float = 5.0, note_write=None):
+        self.dispatcher = dispatcher
+        self.admission = admission
+        self.trunk_id = trunk_id
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.note_write = note_write  # called with the user a retry call was created for
+        self.task: Optional[asyncio.Task] = None
+        # Retries dialled whose result could not be written yet; retried before each pass
+        self.unrecorded: List[Tuple[ClaimedRetry, RetryTarget, str]] = []
+        self.dispatched = 0
+        self.failed = 0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def metrics(self) -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            pending = db.query(CallRetry.id).filter(CallRetry.status == "pending").count()
+            due = (
+                db.query(CallRetry.id)
+                .filter(CallRetry.status == "pending", CallRetry.due_at <= datetime.now())
+                .count()
+            )
+        finally:
+            db.close()
+        return {"pending": pending, "due": due, "dispatched": self.dispatched, "failed": self.failed}
+
+    async def _run(self):
+        while True:
+            try:
+                dispatched = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retry scheduler pass failed: {e}")
+                dispatched = 0
+            # A full batch means more are due right now
+            if dispatched < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_once(self) -> int:
+        await self._record_unrecorded()
+        claimed, due = await asyncio.to_thread(self._claim_due)
+        for retry in claimed:
+            try:
+                await self._dispatch(retry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Still dispatching: requeued once its claim is stale
+                logger.error(f"Retry {retry.attempt} of {retry.root_call_id} failed: {e}")
+        return due
+
+    def _claim_due(self) -> Tuple[List[ClaimedRetry], int]:
+        """Claim the due retries for this worker; returns them and how many were due."""
+        db = SessionLocal()
+        try:
+            # dispatched_at holds the claim time while a retry is dispatching
+            stale = datetime.now() - timedelta(seconds=CALL_RETRY_CLAIM_TIMEOUT_SECONDS)
+            recovered = db.execute(
+                update(CallRetry)
+                .where(CallRetry.status == "dispatching", CallRetry.dispatched_at < stale)
+                .values(status="pending", dispatched_at=None)
+            ).rowcount
+            db.commit()
+            if recovered:
+                logger.warning(f"Requeued {recovered} retries left dispatching")
+
+            due = (
+                db.query(CallRetry.id, CallRetry.call_id, CallRetry.root_call_id, CallRetry.attempt)
+                .filter(CallRetry.status == "pending", CallRetry.due_at <= datetime.now())
+                .order_by(CallRetry.due_at)
+                .limit(self.batch_size)
+                .all()
+            )
+            claimed = []
+            for row in due:
+                # Claim the row so other workers running the scheduler skip it
+                if db.execute(
+                    update(CallRetry)
+                    .where(CallRetry.id == row.id, CallRetry.status == "pending")
+                    .values(status="dispatching", dispatched_at=datetime.now())
+                ).rowcount:
+                    claimed.append(ClaimedRetry(
+                        id=row.id, call_id=row.call_id, root_call_id=row.root_call_id, attempt=row.attempt
+                    ))
+            db.commit()
+            return claimed, len(due)
+        finally:
+            db.close()
+
+    def _load_target(self, retry: ClaimedRetry) -> Optional[RetryTarget]:
+        db = SessionLocal()
+        try:
+            call = (
+                db.query(models.Call)
+                .options(*without_heavy_columns())
+                .filter(models.Call.call_id == retry.call_id)
+                .first()
+            )
+            model = call and db.query(models.Model).filter(models.Model.model_id == call.model_id).first()
+            if call is None or model is None:
+                return None
+            return RetryTarget(
+                user_id=call.user_id, name=call.name, call_to=call.call_to, call_from=call.call_from,
+                call_type=call.call_type, model_id=call.model_id, model_name=model.model_name,
+            )
+        finally:
+            db.close()
+
+    def _set_status(self, retry: ClaimedRetry, **values):
+        db = SessionLocal()
+        try:
+            db.execute(update(CallRetry).where(CallRetry.id == retry.id).values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+    def _record_dispatch(self, retry: ClaimedRetry, target: RetryTarget, room_name: str):
+        """Create the retry's Call row and mark the retry dispatched, in one transaction."""
+        db = SessionLocal()
+        try:
+            db.add(models.Call(
+                user_id=target.user_id,
+                call_id=room_name,
+                name=target.name,
+                call_to=target.call_to,
+                call_from=target.call_from,
+                call_type=target.call_type,
+                model_id=target.model_id,
+                call_transcription=f"{self.base_url}/api/transcript/{room_name}",
+                call_recording_url=f"{self.base_url}/api/stream/{room_name}",
+                call_duration=0,
+                call_status="Ongoing",
+            ))
+            db.execute(
+                update(CallRetry)
+                .where(CallRetry.id == retry.id)
+                .values(status="dispatched", retry_call_id=room_name, dispatched_at=datetime.now())
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def _record(self, retry: ClaimedRetry, target: RetryTarget, room_name: str) -> bool:
+        try:
+            await asyncio.to_thread(self._record_dispatch, retry, target, room_name)
+        except Exception as e:
+            # The call was dialled: keep the result and write it later rather than let the
+            # row go stale and be dialled again
+            logger.error(f"Could not record retry {retry.attempt} of {retry.root_call_id} as {room_name}: {e}")
+            self.unrecorded.append((retry, target, room_name))
+            return False
+        if self.note_write is not None:
+            self.note_write(target.user_id)
+        return True
+
+    async def _record_unrecorded(self):
+        pending, self.unrecorded = self.unrecorded, []
+        for retry, target, room_name in pending:
+            await self._record(retry, target, room_name)
+
+    async def _dispatch(self, retry: ClaimedRetry):
+        target = await asyncio.to_thread(self._load_target, retry)
+        if target is None:
+            await asyncio.to_thread(
+                self._set_status, retry, status="failed", error="Original call or model no longer exists"
+            )
+            self.failed += 1
+            return
+
+        room_name = self.dispatcher.new_room_name()
+        try:
+            # Give up well before the claim could be taken as stale by another worker
+            await self.admission.acquire(
+                room_name, self.trunk_id, target.model_name,
+                lane=LANE_CAMPAIGN, timeout=CALL_RETRY_CLAIM_TIMEOUT_SECONDS / 2,
+            )
+        except DispatchQueueFull:
+            # Put it back; it will be picked up on a later pass
+            await asyncio.to_thread(self._set_status, retry, status="pending", dispatched_at=None)
+            return
+
+        metadata = {"name": target.name, "phone": target.call_to, "agent_name": target.model_name}
+        try:
+            result = await self.dispatcher.dispatch(agent_name=target.model_name, metadata=metadata, room_name=room_name)
+        except Exception:
+            self.admission.release(room_name)
+            raise
+        if not result.success:
+            self.admission.release(room_name)
+            await asyncio.to_thread(self._set_status, retry, status="failed", error=result.error)
+            self.failed += 1
+            return
+
+        self.dispatched += 1
+        if await self._record(retry, target, room_name):
+            logger.info(f"Dispatched retry {retry.attempt} of {retry.root_call_id} as {room_name}")
@@ -0,0 +1,474 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Float, Integer, String, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database.db_test.db import Base, SessionLocal
+from database.db_test import models
+from .dispatch_queue import LANE_CAMPAIGN, DispatchQueueFull
+
+logger = logging.getLogger("campaigns")
+
+CAMPAIGN_INSERT_BATCH_SIZE = int(os.getenv("CAMPAIGN_INSERT_BATCH_SIZE", "1000"))
+# How long a dispatched call holds a concurrency slot if nothing reports its end
+CAMPAIGN_CALL_SLOT_SECONDS = float(os.getenv("CAMPAIGN_CALL_SLOT_SECONDS", "300"))
+# Contacts a worker claims at once cover this many seconds of its dial rate
+CAMPAIGN_CLAIM_WINDOW_SECONDS = float(os.getenv("CAMPAIGN_CLAIM_WINDOW_SECONDS", "10"))
+# A contact still dispatching after this long was claimed by a worker that died; requeue it
+CAMPAIGN_CLAIM_TIMEOUT_SECONDS = float(os.getenv("CAMPAIGN_CLAIM_TIMEOUT_SECONDS", "300"))
+# Pause after a scheduler pass fails (e.g. the database is unreachable) before trying again
+CAMPAIGN_ERROR_BACKOFF_SECONDS = float(os.getenv("CAMPAIGN_ERROR_BACKOFF_SECONDS", "5"))
+
+CONTACT_NUMBER_KEYS = ["contact_number", "phone", "phone_number", "number", "mobile"]
+NAME_KEYS = ["name", "customer_name", "full_name"]
+
+
+class Campaign(Base):
+    __tablename__ = "campaigns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    user_id = Column(Integer, index=True, nullable=False)
+    model_id = Column(String, nullable=False)
+    calls_per_second = Column(Float, nullable=False, default=1.0)
+    max_concurrent_calls = Column(Integer, nullable=False, default=10)
+    status = Column(String, nullable=False, default="created")  # created, running, paused, completed
+    total_contacts = Column(Integer, nullable=False, default=0)
+    invalid_contacts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+
+class CampaignCall(Base):
+    __tablename__ = "campaign_calls"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, index=True, nullable=False)
+    call_id = Column(String, index=True, nullable=False)
+    name = Column(String, nullable=True)
+    contact_number = Column(String, nullable=False)
+    status = Column(String, index=True, nullable=False, default="pending")  # pending, dispatching, dispatched, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    dispatched_at = Column(DateTime, nullable=True)
+
+
+def _first(row: Dict[str, Any], keys: List[str]) -> Optional[str]:
+    for key in keys:
+        value = row.get(key)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+
+def iter_contacts(file_obj, file_format: str) -> Iterator[Dict[str, Any]]:
+    """Yield contact rows one at a time from a CSV (with header) or NDJSON binary file."""
+    text = io.TextIOWrapper(file_obj, encoding="utf-8-sig", newline="")
+    if file_format == "ndjson":
+        for line in text:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                row = None
+            # Unparseable lines and non-object values count as invalid contacts
+            yield row if isinstance(row, dict) else {}
+    else:
+        for row in csv.DictReader(text):
+            yield {(k or "").strip().lower(): v for k, v in row.items()}
+
+
+def ingest_contacts(db: Session, campaign: Campaign, file_obj, file_format: str, room_name) -> Campaign:
+    """
+    Stream contacts from `file_obj` into pending campaign_calls, inserting in
+    batches so memory stays flat regardless of file size. A contact's Call row
+    is only created once it is dispatched, so call history never lists
+    contacts that have not been dialled yet.
+    """
+    links: List[Dict[str, Any]] = []
+
+    def flush():
+        if links:
+            db.execute(insert(CampaignCall), links)
+            db.commit()
+            links.clear()
+
+    for row in iter_contacts(file_obj, file_format):
+        contact_number = _first(row, CONTACT_NUMBER_KEYS)
+        if not contact_number:
+            campaign.invalid_contacts += 1
+            continue
+        if not contact_number.startswith("+"):
+            contact_number = "+" + contact_number
+        name = _first(row, NAME_KEYS) or ""
+        links.append({
+            "campaign_id": campaign.id,
+            "call_id": room_name(),
+            "name": name,
+            "contact_number": contact_number,
+            "status": "pending",
+            "attempts": 0,
+        })
+        campaign.total_contacts += 1
+        if len(links) >= CAMPAIGN_INSERT_BATCH_SIZE:
+            flush()
+
+    flush()
+    db.commit()
+    db.refresh(campaign)
+    return campaign
+
+
+async def campaign_progress(db: AsyncSession, campaign_id: int) -> Dict[str, int]:
+    rows = (await db.execute(
+        select(CampaignCall.status, func.count(CampaignCall.id))
+        .where(CampaignCall.campaign_id == campaign_id)
+        .group_by(CampaignCall.status)
+    )).all()
+    return {status: count for status, count in rows}
+
+
+def ingest_campaign_file(campaign_id: int, file_obj, file_format: str, room_name) -> int:
+    """ingest_contacts on a session of its own, for running in a worker thread. Returns total_contacts."""
+    db = SessionLocal()
+    try:
+        campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+        return ingest_contacts(db, campaign, file_obj, file_format, room_name).total_contacts
+    finally:
+        db.close()
+
+
+@dataclass
+class CampaignRunStats:
+    started_at: float = field(default_factory=time.time)
+    dispatched: int = 0
+    failed: int = 0
+    dispatch_latency_total: float = 0.0
+    active_calls: Dict[str, float] = field(default_factory=dict)  # call_id -> slot expiry
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.time() - self.started_at
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "dispatched": self.dispatched,
+            "failed": self.failed,
+            "active_calls": len(self.active_calls),
+            "dispatches_per_second": round(self.dispatched / elapsed, 3) if elapsed > 0 else 0.0,
+            "avg_dispatch_latency": round(self.dispatch_latency_total / self.dispatched, 3) if self.dispatched else 0.0,
+        }
+
+
+@dataclass
+class CampaignSettings:
+    user_id: int
+    model_id: str
+    model_name: str
+    calls_per_second: float
+    max_concurrent_calls: int
+
+
+@dataclass
+class ClaimedContact:
+    id: int
+    call_id: str
+    name: Optional[str]
+    contact_number: str
+
+
+class CampaignScheduler:
+    """
+    Dispatches pending campaign calls at the campaign's calls-per-second rate
+    while keeping at most `max_concurrent_calls` live at a time. Each dispatch
+    also waits for a trunk slot in the campaign lane of the admission queue.
+
+    Every worker resumes running campaigns, so contacts are claimed before
+    they are dialled (see `_claim`). Pacing and max_concurrent_calls are
+    still enforced per worker.
+    """
+
+    def __init__(self, dispatcher, admission, trunk_id: str, base_url: str, call_from: str,
+                 batch_size: int = 100, poll_interval: float = 0.5, note_write=None):
+        self.dispatcher = dispatcher
+        self.admission = admission
+        self.trunk_id = trunk_id
+        self.base_url = base_url
+        self.call_from = call_from
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.note_write = note_write  # called with the user whose calls were updated
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.stats: Dict[int, CampaignRunStats] = {}
+        # Contacts dialled whose result could not be written yet; retried before each pass
+        self.unrecorded: List[Tuple[CampaignSettings, ClaimedContact, Any]] = []
+
+    def is_running(self, campaign_id: int) -> bool:
+        task = self.tasks.get(campaign_id)
+        return task is not None and not task.done()
+
+    def start(self, campaign_id: int):
+        if self.is_running(campaign_id):
+            return
+        self.stats.setdefault(campaign_id, CampaignRunStats())
+        self.tasks[campaign_id] = asyncio.ensure_future(self._run(campaign_id))
+
+    def stop(self, campaign_id: int):
+        task = self.tasks.pop(campaign_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def close(self):
+        for campaign_id in list(self.tasks):
+            self.stop(campaign_id)
+
+    def release(self, call_id: str):
+        """Free the concurrency slot of a call that has ended."""
+        for stats in self.stats.values():
+            stats.active_calls.pop(call_id, None)
+
+    def _free_slots(self, stats: CampaignRunStats, max_concurrent: int) -> int:
+        now = time.time()
+        for call_id, expiry in list(stats.active_calls.items()):
+            if expiry <= now:
+                del stats.active_calls[call_id]
+        return max_concurrent - len(stats.active_calls)
+
+    async def _run(self, campaign_id: int):
+        stats = self.stats[campaign_id]
+        next_slot = time.monotonic()
+        while True:
+            try:
+                await self._record_unrecorded()
+                # The database work is blocking; keep it off the event loop
+                active = -self._free_slots(stats, 0)
+                claim = await asyncio.to_thread(self._claim, campaign_id, active)
+                if claim is None:
+                    return
+                settings, contacts = claim
+                if not contacts:
+                    if await asyncio.to_thread(self._complete_if_done, campaign_id):
+                        logger.info(f"Campaign {campaign_id} completed: {stats.to_dict()}")
+                        return
+                    # No free slot, or the remaining contacts are claimed by another worker
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+
+                interval = 1.0 / settings.calls_per_second
+                for contact in contacts:
+                    while self._free_slots(stats, settings.max_concurrent_calls) <= 0:
+                        await asyncio.sleep(self.poll_interval)
+                    delay = next_slot - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_slot = max(next_slot, time.monotonic()) + interval
+
+                    try:
+                        await self._dispatch(settings, contact, stats)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        # Not dialled: left dispatching, requeued once its claim is stale
+                        logger.error(f"Campaign {campaign_id}: dispatch of {contact.call_id} failed: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Campaign {campaign_id} scheduler pass failed, retrying: {e}")
+                await asyncio.sleep(CAMPAIGN_ERROR_BACKOFF_SECONDS)
+
+    def _claim(self, campaign_id: int, active_calls: int) -> Optional[Tuple["CampaignSettings", List["ClaimedContact"]]]:
+        """
+        Claim the next pending contacts of a running campaign for this worker
+        (None once the campaign is gone or no longer running): as many as the
+        free concurrency slots allow and can be dialled within
+        CAMPAIGN_CLAIM_WINDOW_SECONDS.
+
+        Rows move pending -> dispatching with conditional UPDATEs, so when
+        several workers run the same campaign each contact is claimed once.
+        Claims older than CAMPAIGN_CLAIM_TIMEOUT_SECONDS, left by a worker
+        that died mid-dispatch, are put back to pending first.
+        """
+        db = SessionLocal()
+        try:
+            campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+            if campaign is None or campaign.status != "running":
+                return None
+            model = db.query(models.Model).filter(models.Model.model_id == campaign.model_id).first()
+            if model is None:
+                logger.error(f"Campaign {campaign_id} agent {campaign.model_id} no longer exists")
+                return None
+            settings = CampaignSettings(
+                user_id=campaign.user_id,
+                model_id=model.model_id,
+                model_name=model.model_name,
+                calls_per_second=campaign.calls_per_second if campaign.calls_per_second > 0 else 1.0,
+                max_concurrent_calls=campaign.max_concurrent_calls,
+            )
+
+            # dispatched_at holds the claim time while a row is dispatching
+            stale = datetime.now() - timedelta(seconds=CAMPAIGN_CLAIM_TIMEOUT_SECONDS)
+            recovered = db.execute(
+                update(CampaignCall)
+                .where(
+                    CampaignCall.campaign_id == campaign_id,
+                    CampaignCall.status == "dispatching",
+                    CampaignCall.dispatched_at < stale,
+                )
+                .values(status="pending", dispatched_at=None)
+            ).rowcount
+            if recovered:
+                logger.warning(f"Campaign {campaign_id}: requeued {recovered} contacts left dispatching")
+            db.commit()
+
+            paced = max(1, math.ceil(settings.calls_per_second * CAMPAIGN_CLAIM_WINDOW_SECONDS))
+            size = min(self.batch_size, paced, settings.max_concurrent_calls - active_calls)
+            if size <= 0:
+                return settings, []
+            pending = (
+                db.query(CampaignCall.id, CampaignCall.call_id, CampaignCall.name, CampaignCall.contact_number)
+                .filter(CampaignCall.campaign_id == campaign_id, CampaignCall.status == "pending")
+                .order_by(CampaignCall.id)
+                .limit(size)
+                .all()
+            )
+            contacts = []
+            for row in pending:
+                # Only rows this UPDATE moves are ours; another worker may have taken the rest
+                claimed = db.execute(
+                    update(CampaignCall)
+                    .where(CampaignCall.id == row.id, CampaignCall.status == "pending")
+                    .values(status="dispatching", dispatched_at=datetime.now())
+                ).rowcount
+                if claimed:
+                    contacts.append(ClaimedContact(
+                        id=row.id, call_id=row.call_id, name=row.name, contact_number=row.contact_number
+                    ))
+            db.commit()
+            return settings, contacts
+        finally:
+            db.close()
+
+    def _complete_if_done(self, campaign_id: int) -> bool:
+        """Mark the campaign completed once no contact is pending or being dispatched."""
+        db = SessionLocal()
+        try:
+            remaining = (
+                db.query(CampaignCall.id)
+                .filter(CampaignCall.campaign_id == campaign_id, CampaignCall.status.in_(["pending", "dispatching"]))
+                .first()
+            )
+            if remaining is not None:
+                return False
+            db.execute(
+                update(Campaign)
+                .where(Campaign.id == campaign_id, Campaign.status == "running")
+                .values(status="completed", completed_at=datetime.now())
+            )
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    async def _dispatch(self, settings: "CampaignSettings", contact: "ClaimedContact", stats: CampaignRunStats):
+        metadata = {
+            "name": contact.name,
+            "phone": contact.contact_number,
+            "agent_name": settings.model_name,
+        }
+        try:
+            # Give up well before the claim could be taken as stale by another worker
+            await self.admission.acquire(
+                contact.call_id, self.trunk_id, settings.model_name,
+                lane=LANE_CAMPAIGN, timeout=CAMPAIGN_CLAIM_TIMEOUT_SECONDS / 2,
+            )
+        except DispatchQueueFull as e:
+            await asyncio.to_thread(self._unclaim, contact)
+            await asyncio.sleep(e.retry_after)
+            return
+        try:
+            result = await self.dispatcher.dispatch(agent_name=settings.model_name, metadata=metadata, room_name=contact.call_id)
+        except Exception:
+            self.admission.release(contact.call_id)
+            raise
+        if result.success:
+            stats.dispatched += 1
+            stats.dispatch_latency_total += result.latency
+            stats.active_calls[contact.call_id] = time.time() + CAMPAIGN_CALL_SLOT_SECONDS
+        else:
+            self.admission.release(contact.call_id)
+            stats.failed += 1
+        await self._record(settings, contact, result)
+
+    async def _record(self, settings: "CampaignSettings", contact: "ClaimedContact", result) -> bool:
+        try:
+            await asyncio.to_thread(self._record_dispatch, settings, contact, result)
+        except Exception as e:
+            # The contact was dialled: keep the result and write it later rather than let the
+            # claim go stale and the contact be dialled again
+            logger.error(f"Could not record dispatch of campaign contact {contact.call_id}: {e}")
+            self.unrecorded.append((settings, contact, result))
+            return False
+        if self.note_write is not None:
+            self.note_write(settings.user_id)
+        return True
+
+    async def _record_unrecorded(self):
+        pending, self.unrecorded = self.unrecorded, []
+        for settings, contact, result in pending:
+            await self._record(settings, contact, result)
+
+    def _unclaim(self, contact: "ClaimedContact"):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(CampaignCall)
+                .where(CampaignCall.id == contact.id, CampaignCall.status == "dispatching")
+                .values(status="pending", dispatched_at=None)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _record_dispatch(self, settings: "CampaignSettings", contact: "ClaimedContact", result):
+        """Mark the contact dispatched or failed and create its Call row, in one transaction."""
+        db = SessionLocal()
+        try:
+            if result.success:
+                values = {"status": "dispatched", "dispatched_at": datetime.now()}
+                call_status = "Ongoing"
+            else:
+                values = {"status": "failed", "error": result.error}
+                call_status = "Dispatch failed"
+            db.execute(
+                update(CampaignCall)
+                .where(CampaignCall.id == contact.id)
+                .values(attempts=CampaignCall.attempts + 1, **values)
+            )
+            db.add(models.Call(
+                user_id=settings.user_id,
+                call_id=contact.call_id,
+                name=contact.name,
+                call_to=contact.contact_number,
+                call_from=self.call_from,
+                call_type="Outbound",
+                model_id=settings.model_id,
+                call_transcription=f"{self.base_url}/api/transcript/{contact.call_id}",
+                call_recording_url=f"{self.base_url}/api/stream/{contact.call_id}",
+                call_duration=0,
+                call_status=call_status,
+            ))
+            db.commit()
+        finally:
+            db.close()
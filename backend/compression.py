@@ -0,0 +1,155 @@
+import logging
+import zlib
+from typing import Optional, Tuple
+
+logger = logging.getLogger("compression")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+    logger.info("brotli is not installed, responses will only be gzip compressed")
+
+# Already compressed or binary payloads gain nothing from another pass
+EXCLUDED_MEDIA_TYPES = ("audio/", "video/", "image/", "application/vnd.apache.parquet",
+                        "application/octet-stream", "application/zip", "application/gzip")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding the client accepts: br (if available), then gzip."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class StreamCompressor:
+    """Incremental gzip/brotli compressor that flushes after each chunk."""
+
+    def __init__(self, encoding: str, gzip_level: int = 6, brotli_quality: int = 4):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool = False) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    return StreamCompressor(encoding, gzip_level, brotli_quality).compress(data, final=True)
+
+
+def add_vary(values, name: bytes) -> bytes:
+    """Merge the response's Vary header values and `name` into one value."""
+    fields = [field.strip() for value in values for field in value.split(b",") if field.strip()]
+    if b"*" not in fields and name.lower() not in {field.lower() for field in fields}:
+        fields.append(name)
+    return b", ".join(fields)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip per Accept-Encoding.
+
+    Complete bodies under `minimum_size` bytes are sent as-is. Streamed bodies
+    (NDJSON/SSE call details, exports) are compressed chunk by chunk with a
+    flush after each, so events still reach the client as they are produced.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                response_headers = start_message.get("headers", [])
+                content_type, already_encoded = _inspect(response_headers)
+                if (
+                    already_encoded
+                    or content_type.startswith(EXCLUDED_MEDIA_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = StreamCompressor(encoding, self.gzip_level, self.brotli_quality)
+                new_headers = [
+                    (k, v) for k, v in response_headers
+                    if k.lower() not in (b"content-length", b"vary")
+                ]
+                vary = [v for k, v in response_headers if k.lower() == b"vary"]
+                new_headers += [(b"content-encoding", encoding.encode()), (b"vary", add_vary(vary, b"Accept-Encoding"))]
+                data = compressor.compress(body, final=not more_body)
+                if not more_body:
+                    new_headers.append((b"content-length", str(len(data)).encode()))
+                await send({**start_message, "headers": new_headers})
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _inspect(headers) -> Tuple[str, bool]:
+    content_type, encoded = "", False
+    for key, value in headers:
+        key = key.lower()
+        if key == b"content-type":
+            content_type = value.decode("latin-1").lower()
+        elif key == b"content-encoding":
+            encoded = True
+    return content_type, encoded
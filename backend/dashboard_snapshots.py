@@ -0,0 +1,214 @@
+"""
+Last-known-good dashboard snapshots, served stale while the database is failing.
+
+Every dashboard computed successfully is kept as the snapshot of its
+(user, client, view, period): in memory, and persisted to
+dashboard_snapshots at most once per DASHBOARD_SNAPSHOT_PERSIST_SECONDS (or
+when it changed), so a restarted worker still has one.
+
+When computing fails with a database error, the snapshot is returned with
+`stale: true` and `snapshot_at`, and one background refresh per key retries
+with backoff. Until that refresh succeeds, requests for the key are served
+the snapshot without querying, so an outage does not turn every dashboard
+poll into another failing query. Without a snapshot the error propagates.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import JSON, Column, DateTime, Integer, String, UniqueConstraint, select, update
+from sqlalchemy.exc import DisconnectionError, IntegrityError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from database.db_test.db import Base
+
+logger = logging.getLogger("dashboard-snapshots")
+
+DASHBOARD_SNAPSHOT_PERSIST_SECONDS = float(os.getenv("DASHBOARD_SNAPSHOT_PERSIST_SECONDS", "60"))
+DASHBOARD_SNAPSHOT_MEMORY_SIZE = int(os.getenv("DASHBOARD_SNAPSHOT_MEMORY_SIZE", "1024"))
+# Delays before each background refresh attempt after a database error
+DASHBOARD_REFRESH_BACKOFF_SECONDS = [
+    float(delay) for delay in os.getenv("DASHBOARD_REFRESH_BACKOFF_SECONDS", "5,15,30,60,120").split(",")
+]
+
+# Errors meaning the database is unreachable or saturated, not that the query is wrong
+DB_UNAVAILABLE_ERRORS = (OperationalError, DisconnectionError, PoolTimeoutError)
+
+SnapshotKey = Tuple[int, str, str, str]  # (user_id, client, view, period)
+
+
+class DashboardSnapshot(Base):
+    __tablename__ = "dashboard_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    client = Column(String, nullable=False)
+    view = Column(String, nullable=False)  # "dashboard" or "summary"
+    period = Column(String, nullable=False)
+    data = Column(JSON, nullable=False)
+    computed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "client", "view", "period", name="uq_dashboard_snapshots_key"),
+    )
+
+
+@dataclass
+class Snapshot:
+    data: Dict[str, Any]
+    computed_at: datetime
+    persisted: float = 0.0  # monotonic time of the last write to dashboard_snapshots
+
+
+def snapshot_key(user_id: int, client: str, view: str, period: str = "") -> SnapshotKey:
+    return (user_id, client.lower(), view, period)
+
+
+class DashboardSnapshotStore:
+    def __init__(self, session_factory, memory_size: int = DASHBOARD_SNAPSHOT_MEMORY_SIZE,
+                 persist_seconds: float = DASHBOARD_SNAPSHOT_PERSIST_SECONDS,
+                 refresh_backoff=DASHBOARD_REFRESH_BACKOFF_SECONDS):
+        self.session_factory = session_factory
+        self.memory_size = memory_size
+        self.persist_seconds = persist_seconds
+        self.refresh_backoff = list(refresh_backoff)
+        self.snapshots: "OrderedDict[SnapshotKey, Snapshot]" = OrderedDict()
+        self.refreshing: Dict[SnapshotKey, asyncio.Task] = {}
+        self.tasks = set()
+        self.stale_served = 0
+        self.refresh_failures = 0
+
+    async def serve(self, key: SnapshotKey, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        compute() marked `stale: false`, or the last-known-good snapshot marked
+        `stale: true` if the database is unavailable. `compute` opens its own
+        session; it is also what the background refresh calls.
+        """
+        if key in self.refreshing:
+            snapshot = await self.get(key)
+            if snapshot is not None:
+                return self._stale(snapshot)
+        try:
+            data = await compute()
+        except DB_UNAVAILABLE_ERRORS as e:
+            snapshot = await self.get(key)
+            if snapshot is None:
+                raise
+            logger.warning(f"Database unavailable for dashboard {key}, serving snapshot of {snapshot.computed_at}: {e}")
+            self.schedule_refresh(key, compute)
+            return self._stale(snapshot)
+        self.remember(key, data)
+        return {**data, "stale": False, "snapshot_at": None}
+
+    def remember(self, key: SnapshotKey, data: Dict[str, Any], persist: bool = False):
+        """Make `data` the snapshot of `key`, writing it through when due or changed."""
+        previous = self.snapshots.get(key)
+        snapshot = Snapshot(data=data, computed_at=datetime.now(), persisted=previous.persisted if previous else 0.0)
+        self._set(key, snapshot)
+        due = time.monotonic() - snapshot.persisted >= self.persist_seconds
+        if persist or due or previous is None or previous.data != data:
+            snapshot.persisted = time.monotonic()
+            task = asyncio.ensure_future(self._persist(key, snapshot))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def get(self, key: SnapshotKey) -> Optional[Snapshot]:
+        """The snapshot in memory, else the persisted one (None if that cannot be read either)."""
+        snapshot = self.snapshots.get(key)
+        if snapshot is not None:
+            self.snapshots.move_to_end(key)
+            return snapshot
+        user_id, client, view, period = key
+        try:
+            async with self.session_factory() as db:
+                row = (await db.execute(
+                    select(DashboardSnapshot.data, DashboardSnapshot.computed_at).where(
+                        DashboardSnapshot.user_id == user_id,
+                        DashboardSnapshot.client == client,
+                        DashboardSnapshot.view == view,
+                        DashboardSnapshot.period == period,
+                    )
+                )).first()
+        except Exception as e:
+            logger.warning(f"Could not load dashboard snapshot {key}: {e}")
+            return None
+        if row is None:
+            return None
+        snapshot = Snapshot(data=row.data, computed_at=row.computed_at, persisted=time.monotonic())
+        self._set(key, snapshot)
+        return snapshot
+
+    def schedule_refresh(self, key: SnapshotKey, compute: Callable[[], Awaitable[Dict[str, Any]]]):
+        if key in self.refreshing:
+            return
+        task = asyncio.ensure_future(self._refresh(key, compute))
+        self.refreshing[key] = task
+        task.add_done_callback(lambda _: self.refreshing.pop(key, None))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "snapshots": len(self.snapshots),
+            "refreshing": len(self.refreshing),
+            "stale_served": self.stale_served,
+            "refresh_failures": self.refresh_failures,
+        }
+
+    def _stale(self, snapshot: Snapshot) -> Dict[str, Any]:
+        self.stale_served += 1
+        return {**snapshot.data, "stale": True, "snapshot_at": snapshot.computed_at}
+
+    def _set(self, key: SnapshotKey, snapshot: Snapshot):
+        self.snapshots[key] = snapshot
+        self.snapshots.move_to_end(key)
+        while len(self.snapshots) > self.memory_size:
+            self.snapshots.popitem(last=False)
+
+    async def _refresh(self, key: SnapshotKey, compute: Callable[[], Awaitable[Dict[str, Any]]]):
+        for delay in self.refresh_backoff:
+            await asyncio.sleep(delay)
+            try:
+                data = await compute()
+            except DB_UNAVAILABLE_ERRORS as e:
+                self.refresh_failures += 1
+                logger.warning(f"Background refresh of dashboard {key} failed, retrying: {e}")
+                continue
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.error(f"Background refresh of dashboard {key} failed: {e}")
+                return
+            self.remember(key, data, persist=True)
+            logger.info(f"Dashboard {key} refreshed after database errors")
+            return
+        logger.warning(f"Giving up refreshing dashboard {key}; the next request will query again")
+
+    async def _persist(self, key: SnapshotKey, snapshot: Snapshot):
+        user_id, client, view, period = key
+        try:
+            async with self.session_factory() as db:
+                changed = (await db.execute(
+                    update(DashboardSnapshot)
+                    .where(
+                        DashboardSnapshot.user_id == user_id,
+                        DashboardSnapshot.client == client,
+                        DashboardSnapshot.view == view,
+                        DashboardSnapshot.period == period,
+                    )
+                    .values(data=snapshot.data, computed_at=snapshot.computed_at)
+                )).rowcount
+                if not changed:
+                    db.add(DashboardSnapshot(
+                        user_id=user_id, client=client, view=view, period=period,
+                        data=snapshot.data, computed_at=snapshot.computed_at,
+                    ))
+                await db.commit()
+        except IntegrityError:
+            pass  # inserted by another worker at the same time
+        except Exception as e:
+            # Kept in memory; the next computation retries the write
+            snapshot.persisted = 0.0
+            logger.warning(f"Could not persist dashboard snapshot {key}: {e}")
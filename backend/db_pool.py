@@ -0,0 +1,143 @@
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger("db-pool")
+
+# Connection liveness is left to the pool: pre-ping on checkout, recycle old connections
+POOL_SETTINGS = {
+    "pool_pre_ping": True,
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30")),
+}
+
+
+class PoolMetrics:
+    """Pool event counters plus checkout wait times for one engine."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine: Engine = None
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=1000)
+
+    def attach(self, engine: Engine) -> "PoolMetrics":
+        self.engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "soft_invalidate", self._on_soft_invalidate)
+        return self
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+        logger.warning(f"{self.name} pool invalidated a connection: {exception}")
+
+    def _on_soft_invalidate(self, dbapi_connection, connection_record, exception):
+        self.soft_invalidations += 1
+
+    def record_wait(self, wait: float):
+        self.wait_count += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.recent_waits.append(wait)
+
+    @contextmanager
+    def timed_checkout(self):
+        """Time acquiring a connection (queueing, connecting and pre-ping)."""
+        start = time.perf_counter()
+        try:
+            yield
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.record_wait(time.perf_counter() - start)
+
+    def to_dict(self) -> Dict[str, Any]:
+        pool = self.engine.pool if self.engine is not None else None
+        recent = sorted(self.recent_waits)
+
+        def pct(p: float) -> float:
+            return round(recent[min(len(recent) - 1, int(p / 100 * len(recent)))] * 1000, 2) if recent else 0.0
+
+        def gauge(name: str):
+            # Not every pool class (e.g. NullPool, StaticPool) tracks these
+            fn = getattr(pool, name, None)
+            return fn() if callable(fn) else None
+
+        return {
+            "pool_class": type(pool).__name__ if pool is not None else None,
+            "size": gauge("size"),
+            "checked_out": gauge("checkedout"),
+            "checked_in": gauge("checkedin"),
+            "overflow": gauge("overflow"),
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "invalidations": self.invalidations,
+            "soft_invalidations": self.soft_invalidations,
+            "checkout_timeouts": self.timeouts,
+            "avg_wait_ms": round(self.wait_total / self.wait_count * 1000, 2) if self.wait_count else 0.0,
+            "p50_wait_ms": pct(50),
+            "p95_wait_ms": pct(95),
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+def apply_pool_settings(engine: Engine) -> Engine:
+    """
+    Give a server-database engine a QueuePool with POOL_SETTINGS, in place.
+
+    The engine is created outside this package (database.db_test.db), so its
+    pool is swapped the way Pool.recreate() does it: same creator (keeping
+    the URL's connect_args), dialect and pool event listeners, and every
+    module importing `engine` keeps using the same object. SQLite engines are
+    left alone: there is no network connection to go stale.
+    """
+    if engine.url.get_backend_name() == "sqlite":
+        return engine
+    old_pool = engine.pool
+    engine.pool = QueuePool(
+        old_pool._creator,
+        pool_size=POOL_SETTINGS["pool_size"],
+        max_overflow=POOL_SETTINGS["max_overflow"],
+        timeout=POOL_SETTINGS["pool_timeout"],
+        recycle=POOL_SETTINGS["pool_recycle"],
+        pre_ping=POOL_SETTINGS["pool_pre_ping"],
+        echo=old_pool.echo,
+        logging_name=old_pool._orig_logging_name,
+        reset_on_return=old_pool._reset_on_return,
+        _dispatch=old_pool.dispatch,
+        dialect=old_pool._dialect,
+    )
+    old_pool.dispose()
+    return engine
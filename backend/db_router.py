@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .async_db import async_url, create_engine_for
+from .db_pool import POOL_SETTINGS, PoolMetrics
+
+logger = logging.getLogger("db-router")
+
+# Carries the read-your-writes window on the client, so it holds on whichever worker serves the next read
+RYW_COOKIE = "ryw_until"
+RYW_HEADER = "X-Read-Your-Writes-Until"
+
+# Seconds of replay lag on a streaming replica; 0 when it has replayed everything it received
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReadReplicaRouter:
+    """
+    Routes read-only endpoints to a read replica while it is healthy and caught up.
+
+    A background task samples the replica's replication lag. Reads fall back to
+    the primary when the replica is unreachable or lags more than `max_lag`,
+    and for `ryw_window` seconds after a user's write (read-your-writes), since
+    the write may not have reached the replica yet.
+
+    A write made in a request hands the window back to the client as the
+    ryw_until cookie and X-Read-Your-Writes-Until header; reads sending either
+    go to the primary until then, on any worker. Writes made outside the
+    user's requests (webhooks, agent callbacks, schedulers) can only be
+    remembered by the worker that made them.
+    """
+
+    def __init__(self, replica_url: Optional[str], max_lag: float = 5.0,
+                 ryw_window: float = 10.0, check_interval: float = 5.0):
+        self.replica_url = replica_url
+        self.max_lag = max_lag
+        self.ryw_window = ryw_window
+        self.check_interval = check_interval
+
+        self.engine = None
+        self.SessionLocal = None
+        self.async_engine = None
+        self.AsyncSessionLocal = None
+        self.pool_metrics = PoolMetrics("replica")
+        self.async_pool_metrics = PoolMetrics("replica_async")
+
+        self.lag: Optional[float] = None
+        self.healthy = False
+        self.last_error: Optional[str] = None
+        self.recent_writes: Dict[str, float] = {}
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._task: Optional[asyncio.Task] = None
+
+        if replica_url:
+            url = make_url(replica_url)
+            self.engine = create_engine(url, **POOL_SETTINGS)
+            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+            self.pool_metrics.attach(self.engine)
+            try:
+                self.async_engine = create_engine_for(async_url(url))
+                self.AsyncSessionLocal = async_sessionmaker(self.async_engine, expire_on_commit=False)
+                self.async_pool_metrics.attach(self.async_engine.sync_engine)
+            except Exception as e:
+                logger.error(f"Async replica engine unavailable: {e}")
+
+    @classmethod
+    def from_env(cls) -> "ReadReplicaRouter":
+        return cls(
+            replica_url=os.getenv("READ_REPLICA_URL"),
+            max_lag=float(os.getenv("READ_REPLICA_MAX_LAG_SECONDS", "5")),
+            ryw_window=float(os.getenv("READ_YOUR_WRITES_SECONDS", "10")),
+            check_interval=float(os.getenv("READ_REPLICA_CHECK_SECONDS", "5")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    def note_write(self, user_id: Any, response=None):
+        """
+        Pin `user_id`'s reads to the primary for the read-your-writes window,
+        and the reads of the client `response` goes to.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        until = now + self.ryw_window
+        if user_id is not None:
+            self.recent_writes[str(user_id)] = until
+            # Keep the map from growing with users that stopped writing
+            if len(self.recent_writes) > 10000:
+                self.recent_writes = {k: v for k, v in self.recent_writes.items() if v > now}
+        if response is not None:
+            response.set_cookie(RYW_COOKIE, f"{until:.3f}", max_age=int(math.ceil(self.ryw_window)), httponly=True, samesite="lax")
+            response.headers[RYW_HEADER] = f"{until:.3f}"
+
+    def pinned_until(self, request) -> float:
+        """End of the read-your-writes window the client sent back, 0 if none."""
+        value = request.headers.get(RYW_HEADER) or request.cookies.get(RYW_COOKIE)
+        try:
+            until = float(value) if value else 0.0
+        except ValueError:
+            return 0.0
+        # A client cannot pin itself to the primary for longer than one window
+        return min(until, time.time() + self.ryw_window)
+
+    def use_replica(self, user_id: Any = None, async_session: bool = False, pinned_until: float = 0.0) -> bool:
+        if not self.enabled or not self.healthy:
+            return False
+        if async_session and self.AsyncSessionLocal is None:
+            return False
+        if self.lag is None or self.lag > self.max_lag:
+            return False
+        now = time.time()
+        if pinned_until > now:
+            return False
+        if user_id is not None and self.recent_writes.get(str(user_id), 0) > now:
+            return False
+        return True
+
+    def session_factory(self, user_id, primary_factory, primary_metrics, async_session: bool = False,
+                        pinned_until: float = 0.0):
+        """(sessionmaker, PoolMetrics) to read from for this request."""
+        if self.use_replica(user_id, async_session=async_session, pinned_until=pinned_until):
+            self.replica_reads += 1
+            if async_session:
+                return self.AsyncSessionLocal, self.async_pool_metrics
+            return self.SessionLocal, self.pool_metrics
+        self.primary_reads += 1
+        return primary_factory, primary_metrics
+
+    def is_replica(self, factory) -> bool:
+        return factory is not None and factory in (self.SessionLocal, self.AsyncSessionLocal)
+
+    def mark_unhealthy(self, error: Exception):
+        self.healthy = False
+        self.last_error = str(error)
+        logger.warning(f"Read replica unavailable, reading from primary: {error}")
+
+    def check_lag(self) -> Optional[float]:
+        with self.engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                return 0.0
+            return float(conn.execute(REPLICA_LAG_SQL).scalar() or 0.0)
+
+    async def _monitor(self):
+        while True:
+            try:
+                self.lag = await asyncio.to_thread(self.check_lag)
+                self.healthy = True
+                self.last_error = None
+                if self.lag > self.max_lag:
+                    logger.warning(f"Read replica lag {self.lag:.1f}s exceeds {self.max_lag}s, reading from primary")
+            except Exception as e:
+                self.mark_unhealthy(e)
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._monitor())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        if self.engine is not None:
+            self.engine.dispose()
+
+    def metrics(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "max_lag_seconds": self.max_lag,
+            "last_error": self.last_error,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "pool": self.pool_metrics.to_dict(),
+            "async_pool": self.async_pool_metrics.to_dict(),
+        }
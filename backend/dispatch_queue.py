@@ -0,0 +1,387 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger("dispatch-queue")
+
+# Priority lanes, lower is served first
+LANE_INTERACTIVE = 0
+LANE_CAMPAIGN = 1
+LANE_NAMES = {LANE_INTERACTIVE: "interactive", LANE_CAMPAIGN: "campaign"}
+
+# Drops expired leases from the trunk and agent sets and adds `call_id` to both
+# only if neither is at its limit. Expiry scores use Redis server time.
+ACQUIRE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local limits = {tonumber(ARGV[1]), tonumber(ARGV[2])}
+local ttl = tonumber(ARGV[3])
+for i = 1, 2 do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+    if redis.call('ZCARD', KEYS[i]) >= limits[i] then
+        return 0
+    end
+end
+for i = 1, 2 do
+    redis.call('ZADD', KEYS[i], now + ttl, ARGV[4])
+    redis.call('EXPIRE', KEYS[i], math.ceil(ttl))
+end
+redis.call('HSET', KEYS[3], 'trunk', KEYS[1], 'agent', KEYS[2])
+redis.call('EXPIRE', KEYS[3], math.ceil(ttl))
+return 1
+"""
+
+RELEASE_SCRIPT = """
+local lease = redis.call('HMGET', KEYS[1], 'trunk', 'agent')
+if not lease[1] then
+    return 0
+end
+redis.call('ZREM', lease[1], ARGV[1])
+redis.call('ZREM', lease[2], ARGV[1])
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+RENAME_SCRIPT = """
+local lease = redis.call('HMGET', KEYS[1], 'trunk', 'agent')
+if not lease[1] then
+    return 0
+end
+for i = 1, 2 do
+    local expires = redis.call('ZSCORE', lease[i], ARGV[1])
+    if expires then
+        redis.call('ZREM', lease[i], ARGV[1])
+        redis.call('ZADD', lease[i], expires, ARGV[2])
+    end
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+return 1
+"""
+
+
+class DispatchQueueFull(Exception):
+    """Raised when a dispatch cannot be admitted; callers should answer 429."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Lease:
+    call_id: str
+    trunk_id: str
+    agent_name: str
+    lane: int
+    expires_at: float
+
+
+@dataclass(order=True)
+class _Waiter:
+    lane: int
+    seq: int
+    call_id: str = field(compare=False)
+    trunk_id: str = field(compare=False)
+    agent_name: str = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class WaitStats:
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def add(self, wait: float):
+        self.admitted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.recent.append(wait)
+
+    def to_dict(self) -> Dict[str, float]:
+        recent = sorted(self.recent)
+
+        def pct(p: float) -> float:
+            return round(recent[min(len(recent) - 1, int(p / 100 * len(recent)))], 3) if recent else 0.0
+
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": round(self.wait_total / self.admitted, 3) if self.admitted else 0.0,
+            "p50_wait_seconds": pct(50),
+            "p95_wait_seconds": pct(95),
+            "max_wait_seconds": round(self.wait_max, 3),
+        }
+
+
+class DispatchAdmissionQueue:
+    """
+    Admission control for outbound dispatches.
+
+    Every live call holds a lease on its SIP trunk and agent. When a trunk or
+    agent is at its concurrency limit, dispatches wait in priority lanes
+    (interactive ahead of campaign). Leases end via `release(call_id)` when the
+    call finishes, or expire after `slot_ttl` if nothing reports the end.
+
+    With `redis_url` (DISPATCH_LEASES_REDIS_URL) the leases live in Redis, so
+    the limits hold across workers and a release received by any worker
+    frees the slot; waiters poll every `shared_poll_interval` for slots
+    freed elsewhere. The priority lanes stay per process. Without it leases
+    are per process: run a single worker, or divide the limits by the
+    number of workers.
+    """
+
+    def __init__(
+        self,
+        trunk_limits: Optional[Dict[str, int]] = None,
+        default_trunk_limit: int = 20,
+        agent_limits: Optional[Dict[str, int]] = None,
+        default_agent_limit: int = 10,
+        max_queue_depth: Optional[Dict[int, int]] = None,
+        slot_ttl: float = 600.0,
+        retry_after: int = 5,
+        redis_url: Optional[str] = None,
+        shared_poll_interval: float = 0.5,
+        namespace: str = "dispatch",
+    ):
+        self.trunk_limits = trunk_limits or {}
+        self.default_trunk_limit = default_trunk_limit
+        self.agent_limits = agent_limits or {}
+        self.default_agent_limit = default_agent_limit
+        self.max_queue_depth = max_queue_depth or {LANE_INTERACTIVE: 20, LANE_CAMPAIGN: 1000}
+        self.slot_ttl = slot_ttl
+        self.retry_after = retry_after
+        self.redis_url = redis_url
+        self.shared_poll_interval = shared_poll_interval
+        self.namespace = namespace
+        self._redis = None
+        self._pump_lock: Optional[asyncio.Lock] = None
+        self._tasks = set()
+
+        self.leases: Dict[str, Lease] = {}
+        self.waiters: List[_Waiter] = []
+        self.wait_stats: Dict[int, WaitStats] = {lane: WaitStats() for lane in LANE_NAMES}
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> "DispatchAdmissionQueue":
+        return cls(
+            trunk_limits=json.loads(os.getenv("DISPATCH_TRUNK_LIMITS", "{}")),
+            default_trunk_limit=int(os.getenv("DISPATCH_TRUNK_MAX_CHANNELS", "20")),
+            agent_limits=json.loads(os.getenv("DISPATCH_AGENT_LIMITS", "{}")),
+            default_agent_limit=int(os.getenv("DISPATCH_AGENT_MAX_CONCURRENT", "10")),
+            max_queue_depth={
+                LANE_INTERACTIVE: int(os.getenv("DISPATCH_INTERACTIVE_QUEUE_DEPTH", "20")),
+                LANE_CAMPAIGN: int(os.getenv("DISPATCH_CAMPAIGN_QUEUE_DEPTH", "1000")),
+            },
+            slot_ttl=float(os.getenv("DISPATCH_SLOT_TTL_SECONDS", "600")),
+            retry_after=int(os.getenv("DISPATCH_RETRY_AFTER_SECONDS", "5")),
+            redis_url=os.getenv("DISPATCH_LEASES_REDIS_URL"),
+        )
+
+    async def _get_redis(self):
+        if not self.redis_url:
+            return None
+        if self._redis is None:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(self.redis_url)
+            except ImportError:
+                logger.error("Redis not available. Install redis with: pip install redis")
+                self.redis_url = None
+                return None
+        return self._redis
+
+    def _lease_key(self, call_id: str) -> str:
+        return f"{self.namespace}:lease:{call_id}"
+
+    def _active(self, trunk_id: Optional[str] = None, agent_name: Optional[str] = None) -> int:
+        return sum(
+            1 for lease in self.leases.values()
+            if (trunk_id is None or lease.trunk_id == trunk_id)
+            and (agent_name is None or lease.agent_name == agent_name)
+        )
+
+    def _has_capacity(self, trunk_id: str, agent_name: str) -> bool:
+        trunk_limit = self.trunk_limits.get(trunk_id, self.default_trunk_limit)
+        agent_limit = self.agent_limits.get(agent_name, self.default_agent_limit)
+        return self._active(trunk_id=trunk_id) < trunk_limit and self._active(agent_name=agent_name) < agent_limit
+
+    def _expire(self):
+        now = time.time()
+        for call_id in [c for c, lease in self.leases.items() if lease.expires_at <= now]:
+            # A shared lease is only mirrored here; another worker may have released it
+            if not self.redis_url:
+                logger.warning(f"Dispatch slot for {call_id} expired without a release")
+            del self.leases[call_id]
+
+    def _grant(self, call_id: str, trunk_id: str, agent_name: str, lane: int):
+        self.leases[call_id] = Lease(call_id, trunk_id, agent_name, lane, time.time() + self.slot_ttl)
+
+    async def _take(self, call_id: str, trunk_id: str, agent_name: str, lane: int) -> bool:
+        """Grant `call_id` a lease if its trunk and agent have capacity."""
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                taken = await redis.eval(
+                    ACQUIRE_SCRIPT, 3,
+                    f"{self.namespace}:trunk:{trunk_id}", f"{self.namespace}:agent:{agent_name}",
+                    self._lease_key(call_id),
+                    self.trunk_limits.get(trunk_id, self.default_trunk_limit),
+                    self.agent_limits.get(agent_name, self.default_agent_limit),
+                    self.slot_ttl, call_id,
+                )
+                if taken:
+                    # Mirrored locally for metrics
+                    self._grant(call_id, trunk_id, agent_name, lane)
+                return bool(taken)
+            except Exception as e:
+                logger.warning(f"Redis dispatch leases unavailable, using local leases: {e}")
+        if not self._has_capacity(trunk_id, agent_name):
+            return False
+        self._grant(call_id, trunk_id, agent_name, lane)
+        return True
+
+    async def _pump(self):
+        """Grant waiting dispatches in priority order while capacity allows."""
+        if self._pump_lock is None:
+            self._pump_lock = asyncio.Lock()
+        async with self._pump_lock:
+            self._expire()
+            self.waiters.sort()
+            for waiter in list(self.waiters):
+                if waiter.future.done():
+                    self.waiters.remove(waiter)
+                    continue
+                # A full agent must not block other agents on the same trunk
+                if await self._take(waiter.call_id, waiter.trunk_id, waiter.agent_name, waiter.lane):
+                    self.waiters.remove(waiter)
+                    if waiter.future.done():
+                        # Gave up while Redis answered; hand the slot back
+                        self._schedule(self._release(waiter.call_id))
+                    else:
+                        waiter.future.set_result(True)
+
+    def _next_expiry_in(self) -> float:
+        if self.redis_url:
+            # Slots can be freed by releases on other workers
+            return self.shared_poll_interval
+        if not self.leases:
+            return self.slot_ttl
+        return max(0.05, min(lease.expires_at for lease in self.leases.values()) - time.time())
+
+    def queue_depth(self, lane: int) -> int:
+        return sum(1 for w in self.waiters if w.lane == lane and not w.future.done())
+
+    async def acquire(self, call_id: str, trunk_id: str, agent_name: str,
+                      lane: int = LANE_INTERACTIVE, timeout: Optional[float] = None):
+        """
+        Wait for a slot on `trunk_id` and `agent_name` for `call_id`.
+
+        Raises DispatchQueueFull when the lane is already at its queue depth, or
+        when no slot frees up within `timeout` seconds.
+        """
+        stats = self.wait_stats[lane]
+        await self._pump()
+        if not self.waiters and await self._take(call_id, trunk_id, agent_name, lane):
+            stats.add(0.0)
+            return
+
+        if self.queue_depth(lane) >= self.max_queue_depth[lane]:
+            stats.rejected += 1
+            raise DispatchQueueFull(f"Dispatch queue for {LANE_NAMES[lane]} calls is full", self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        waiter = _Waiter(lane, next(self._seq), call_id, trunk_id, agent_name, start, loop.create_future())
+        self.waiters.append(waiter)
+        await self._pump()
+        try:
+            while not waiter.future.done():
+                wait = self._next_expiry_in()
+                if timeout is not None:
+                    remaining = timeout - (loop.time() - start)
+                    if remaining <= 0:
+                        stats.timed_out += 1
+                        raise DispatchQueueFull(f"No dispatch slot free on trunk {trunk_id} for {agent_name}", self.retry_after)
+                    wait = min(wait, remaining)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), timeout=wait)
+                except asyncio.TimeoutError:
+                    await self._pump()
+        finally:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        stats.add(loop.time() - start)
+
+    def rename(self, old_call_id: str, new_call_id: str):
+        """Re-key a lease once the real room id is known."""
+        lease = self.leases.pop(old_call_id, None)
+        if lease is not None:
+            lease.call_id = new_call_id
+            self.leases[new_call_id] = lease
+        if self.redis_url:
+            self._schedule(self._shared(
+                RENAME_SCRIPT, 2, self._lease_key(old_call_id), self._lease_key(new_call_id),
+                old_call_id, new_call_id,
+            ))
+
+    def release(self, call_id: str):
+        """Free the slot held by `call_id` and admit the next waiting dispatch."""
+        if self.redis_url:
+            # The lease may have been granted by another worker
+            self.leases.pop(call_id, None)
+            self._schedule(self._release(call_id))
+        elif self.leases.pop(call_id, None) is not None:
+            self._schedule(self._pump())
+
+    async def _release(self, call_id: str):
+        self.leases.pop(call_id, None)
+        await self._shared(RELEASE_SCRIPT, 1, self._lease_key(call_id), call_id)
+        await self._pump()
+
+    async def _shared(self, script: str, numkeys: int, *args):
+        redis = await self._get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.eval(script, numkeys, *args)
+        except Exception as e:
+            logger.warning(f"Failed to update shared dispatch lease {args[numkeys]}: {e}")
+
+    def _schedule(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def metrics(self) -> Dict[str, object]:
+        self._expire()
+        trunks = {lease.trunk_id for lease in self.leases.values()} | set(self.trunk_limits)
+        agents = {lease.agent_name for lease in self.leases.values()} | set(self.agent_limits)
+        return {
+            "queue_depth": {name: self.queue_depth(lane) for lane, name in LANE_NAMES.items()},
+            "wait_time": {name: self.wait_stats[lane].to_dict() for lane, name in LANE_NAMES.items()},
+            "active_calls": len(self.leases),  # this worker's leases when shared
+            "shared": bool(self.redis_url),
+            "trunks": {
+                trunk: {"active": self._active(trunk_id=trunk), "limit": self.trunk_limits.get(trunk, self.default_trunk_limit)}
+                for trunk in trunks
+            },
+            "agents": {
+                agent: {"active": self._active(agent_name=agent), "limit": self.agent_limits.get(agent, self.default_agent_limit)}
+                for agent in agents
+            },
+        }
@@ -0,0 +1,203 @@
+"""
+Extracted entities as an indexed (call, field, normalized value) table.
+
+call_entity is opaque JSON, so filtering or counting calls by an extracted
+value meant loading every row. Whenever entities are stored for a call, its
+facet rows are replaced here: one row per field value, normalized (case,
+whitespace, surrounding punctuation) so "Mumbai", " mumbai." and "MUMBAI"
+count together. Facet rows carry the call's user, client and start time,
+so counts over a date range are answered from the facet indexes alone.
+
+    python -m backend.entity_facets backfill   # facets for entities stored before this existed
+"""
+import argparse
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String, delete, func, select, union_all
+from sqlalchemy.orm import sessionmaker
+
+from database.db_test.db import Base
+from database.db_test import models
+from .call_archive import ArchivedCall, select_archived_call_rows
+from .call_queries import select_call_rows
+
+logger = logging.getLogger("entity-facets")
+
+MAX_VALUE_LENGTH = 200
+# Extractor placeholders for "nothing found", not facet values
+EMPTY_VALUES = {"", "null", "none", "n/a", "na", "not mentioned", "not specified", "unknown", "not available"}
+
+
+class CallEntityFacet(Base):
+    __tablename__ = "call_entity_facets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    call_id = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    client = Column(String, nullable=False)
+    field = Column(String, nullable=False)
+    value = Column(String, nullable=False)  # as extracted, for display
+    normalized_value = Column(String, nullable=False)
+    confidence = Column(Float, nullable=True)
+    call_started_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_call_entity_facets_call_id", "call_id"),
+        # Filters: field = value within a client (and date range)
+        Index("ix_call_entity_facets_filter", "client", "field", "normalized_value", "call_started_at"),
+        # Top-N counts: every value of a field within a client and date range
+        Index("ix_call_entity_facets_field_started", "client", "field", "call_started_at"),
+    )
+
+
+def normalize_value(value: Any) -> Optional[str]:
+    text = re.sub(r"\s+", " ", str(value)).strip().strip(".,;:!?\"'").strip().casefold()
+    if text in EMPTY_VALUES:
+        return None
+    return text[:MAX_VALUE_LENGTH]
+
+
+def iter_entity_values(entity: Any) -> Iterator[Tuple[str, str, str, Optional[float]]]:
+    """(field, value, normalized value, confidence) for every extracted value; lists give one row each."""
+    if not isinstance(entity, dict):
+        return
+    for field, raw in entity.items():
+        confidence = None
+        if isinstance(raw, dict):
+            confidence = raw.get("confidence")
+            raw = raw.get("value", raw.get("text"))
+        for value in raw if isinstance(raw, list) else [raw]:
+            if value is None or isinstance(value, (dict, list)):
+                continue
+            normalized = normalize_value(value)
+            if normalized is not None:
+                yield field, str(value).strip()[:MAX_VALUE_LENGTH], normalized, confidence if isinstance(confidence, (int, float)) else None
+
+
+def facet_rows(call, client: str, entity: Any) -> List[Dict[str, Any]]:
+    return [
+        {
+            "call_id": call.call_id,
+            "user_id": call.user_id,
+            "client": client.lower(),
+            "field": field,
+            "value": value,
+            "normalized_value": normalized,
+            "confidence": confidence,
+            "call_started_at": call.call_started_at,
+        }
+        for field, value, normalized, confidence in iter_entity_values(entity)
+    ]
+
+
+async def replace_call_facets(db, call, client: str, entity: Any):
+    """Replace the facet rows of a call with those of `entity` (caller commits)."""
+    await db.execute(delete(CallEntityFacet).where(CallEntityFacet.call_id == call.call_id))
+    rows = facet_rows(call, client, entity)
+    if rows:
+        await db.execute(CallEntityFacet.__table__.insert(), rows)
+
+
+def _scope(query, client: str, start: Optional[datetime], end: Optional[datetime], user_id: Optional[int]):
+    query = query.where(CallEntityFacet.client == client.lower())
+    if start is not None:
+        query = query.where(CallEntityFacet.call_started_at >= start)
+    if end is not None:
+        query = query.where(CallEntityFacet.call_started_at < end)
+    if user_id is not None:
+        query = query.where(CallEntityFacet.user_id == user_id)
+    return query
+
+
+async def facet_counts(db, client: str, fields: List[str], start: Optional[datetime] = None,
+                       end: Optional[datetime] = None, user_id: Optional[int] = None,
+                       limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+    """Top `limit` values per field by number of calls, with a sample of how each was written."""
+    counts = {}
+    for field in fields:
+        calls = func.count(func.distinct(CallEntityFacet.call_id)).label("calls")
+        query = _scope(
+            select(CallEntityFacet.normalized_value, func.min(CallEntityFacet.value).label("value"), calls)
+            .where(CallEntityFacet.field == field),
+            client, start, end, user_id,
+        ).group_by(CallEntityFacet.normalized_value).order_by(calls.desc(), CallEntityFacet.normalized_value).limit(limit)
+        counts[field] = [
+            {"value": row.value, "normalized_value": row.normalized_value, "calls": row.calls}
+            for row in (await db.execute(query)).all()
+        ]
+    return counts
+
+
+async def filter_calls(db, client: str, filters: List[Tuple[str, str]], start: Optional[datetime] = None,
+                       end: Optional[datetime] = None, user_id: Optional[int] = None,
+                       limit: int = 50, offset: int = 0):
+    """Listing rows of calls having every (field, value) in `filters`, newest first."""
+    if not filters:
+        return []
+    matches = None
+    for field, value in filters:
+        normalized = normalize_value(value)
+        subquery = _scope(
+            select(CallEntityFacet.call_id).where(
+                CallEntityFacet.field == field, CallEntityFacet.normalized_value == normalized
+            ),
+            client, start, end, user_id,
+        )
+        matches = subquery if matches is None else matches.intersect(subquery)
+
+    # Facet rows outlive archival, so archived calls match from the archived_calls index
+    rows = union_all(
+        select_call_rows().where(models.Call.call_id.in_(matches)),
+        select_archived_call_rows().where(ArchivedCall.call_id.in_(matches)),
+    ).subquery()
+    query = (
+        select(rows)
+        .order_by(rows.c.call_started_at.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    return (await db.execute(query)).all()
+
+
+def backfill(engine, batch_size: int = 500) -> int:
+    """Facet rows for every call with stored entities; returns the number of calls processed."""
+    Session = sessionmaker(bind=engine)
+    processed, last_id = 0, 0
+    with Session() as db:
+        while True:
+            rows = db.execute(
+                select(
+                    models.Call.id, models.Call.call_id, models.Call.user_id, models.Call.call_started_at,
+                    models.Call.call_entity, models.Model.client_name,
+                )
+                .join(models.Model, models.Model.model_id == models.Call.model_id)
+                .where(models.Call.id > last_id, models.Call.call_entity.isnot(None))
+                .order_by(models.Call.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            db.execute(delete(CallEntityFacet).where(CallEntityFacet.call_id.in_([row.call_id for row in rows])))
+            facets = [facet for row in rows for facet in facet_rows(row, row.client_name or "", row.call_entity)]
+            if facets:
+                db.execute(CallEntityFacet.__table__.insert(), facets)
+            db.commit()
+            processed += len(rows)
+            last_id = rows[-1].id
+    return processed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Entity facet index")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from database.db_test.db import engine
+
+    Base.metadata.create_all(bind=engine)
+    print(f"Indexed entities of {backfill(engine, args.batch_size)} calls")
@@ -0,0 +1,364 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, String, case, func, select
+
+from database.db_test.db import Base
+from .request_metrics import record_span
+
+logger = logging.getLogger("eval-metrics")
+
+# USD per 1M tokens as (prompt, completion)
+MODEL_PRICING_PER_1M = {
+    "gpt-3.5-turbo-0125": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+# Call/client the current eval work belongs to, set by the API around evaluations
+_eval_scope: contextvars.ContextVar[Dict[str, Optional[str]]] = contextvars.ContextVar(
+    "eval_scope", default={"call_id": None, "client": None}
+)
+# Tracker of the eval invocation in progress, so completions can report re-sends
+_current_tracker: contextvars.ContextVar[Optional["EvalTracker"]] = contextvars.ContextVar(
+    "eval_tracker", default=None
+)
+
+
+class EvalMetricRecord(Base):
+    __tablename__ = "eval_metric_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, nullable=False)
+    call_id = Column(String, nullable=True)
+    client = Column(String, nullable=True)
+    operation = Column(String, nullable=False)
+    model = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    wall_time = Column(Float, nullable=False, default=0.0)
+    retries = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0.0)
+    success = Column(Boolean, nullable=False, default=True)
+
+    __table_args__ = (
+        Index("ix_eval_metric_records_call_id", "call_id"),
+        Index("ix_eval_metric_records_client_operation", "client", "operation"),
+    )
+
+
+@dataclass
+class EvalRecord:
+    """Cost and latency of one eval invocation (summary, extraction or conversation eval)"""
+    timestamp: float
+    call_id: Optional[str]
+    client: Optional[str]
+    operation: str
+    model: Optional[str]
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    wall_time: float = 0.0
+    retries: int = 0
+    cost_usd: float = 0.0
+    success: bool = True
+
+    def to_row(self) -> Dict[str, Any]:
+        row = asdict(self)
+        row["created_at"] = datetime.fromtimestamp(row.pop("timestamp"))
+        return row
+
+
+@dataclass
+class EvalAggregate:
+    count: int = 0
+    errors: int = 0
+    retries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    wall_time_total: float = 0.0
+    wall_time_max: float = 0.0
+    recent_wall_times: List[float] = field(default_factory=list)
+
+    def add_totals(self, row):
+        """Add one (client, operation) group of the summary query."""
+        self.count += row.count
+        self.errors += row.errors or 0
+        self.retries += row.retries or 0
+        self.prompt_tokens += row.prompt_tokens or 0
+        self.completion_tokens += row.completion_tokens or 0
+        self.cost_usd += row.cost_usd or 0.0
+        self.wall_time_total += row.wall_time_total or 0.0
+        self.wall_time_max = max(self.wall_time_max, row.wall_time_max or 0.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_wall_times)
+
+        def pct(p: float) -> float:
+            return round(recent[min(len(recent) - 1, int(p / 100 * len(recent)))], 3) if recent else 0.0
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "avg_wall_time": round(self.wall_time_total / self.count, 3) if self.count else 0.0,
+            "p50_wall_time": pct(50),
+            "p95_wall_time": pct(95),
+            "max_wall_time": round(self.wall_time_max, 3),
+        }
+
+
+class EvalMetricsStore:
+    """
+    Eval records per call, with aggregates per client and operation.
+
+    Records are persisted to eval_metric_records, so summaries cover every
+    worker and survive restarts. track_eval runs inside request handling, so
+    records are buffered (at most `max_pending`) and written in batches every
+    `flush_interval` seconds by the task started with start(). When
+    `file_path` is set they are also appended, in the same flush and off the
+    event loop, to a JSONL file for offline analysis. Percentiles are taken over the latest `percentile_sample` records.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, max_pending: int = 10000,
+                 percentile_sample: int = 5000, file_path: Optional[str] = None):
+        self.flush_interval = flush_interval
+        self.percentile_sample = percentile_sample
+        self.file_path = file_path
+        self.pending: deque = deque(maxlen=max_pending)
+        self.pending_lines: deque = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.session_factory = None
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, record: EvalRecord):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(record)
+        if self.file_path:
+            self.pending_lines.append(json.dumps(asdict(record)) + "\n")
+
+    def start(self, session_factory):
+        self.session_factory = session_factory
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+
+    async def flush(self):
+        """Write the buffered records; on failure they stay buffered for the next flush."""
+        await self._flush_file()
+        if self.session_factory is None or not self.pending:
+            return
+        batch = list(self.pending)
+        self.pending.clear()
+        try:
+            async with self.session_factory() as db:
+                await db.execute(EvalMetricRecord.__table__.insert(), [record.to_row() for record in batch])
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to persist {len(batch)} eval metric records: {e}")
+            # Oldest records are the ones dropped if the buffer overflows meanwhile
+            self.pending = deque(batch + list(self.pending), maxlen=self.pending.maxlen)
+
+    async def _flush_file(self):
+        if not self.pending_lines:
+            return
+        lines = list(self.pending_lines)
+        self.pending_lines.clear()
+        try:
+            await asyncio.to_thread(self._append_lines, lines)
+        except OSError as e:
+            logger.warning(f"Failed to write {len(lines)} eval metrics to {self.file_path}: {e}")
+
+    def _append_lines(self, lines: List[str]):
+        with open(self.file_path, "a") as f:
+            f.writelines(lines)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def get_call(self, db, call_id: str) -> List[Dict[str, Any]]:
+        await self.flush()
+        rows = (await db.execute(
+            select(EvalMetricRecord).where(EvalMetricRecord.call_id == call_id).order_by(EvalMetricRecord.id)
+        )).scalars().all()
+        return [
+            {
+                "timestamp": row.created_at.timestamp(),
+                "call_id": row.call_id,
+                "client": row.client,
+                "operation": row.operation,
+                "model": row.model,
+                "prompt_tokens": row.prompt_tokens,
+                "completion_tokens": row.completion_tokens,
+                "wall_time": row.wall_time,
+                "retries": row.retries,
+                "cost_usd": row.cost_usd,
+                "success": row.success,
+            }
+            for row in rows
+        ]
+
+    async def summary(self, db) -> Dict[str, Any]:
+        await self.flush()
+        R = EvalMetricRecord
+        groups = (await db.execute(
+            select(
+                R.client, R.operation,
+                func.count(R.id).label("count"),
+                func.sum(case((R.success.is_(False), 1), else_=0)).label("errors"),
+                func.sum(R.retries).label("retries"),
+                func.sum(R.prompt_tokens).label("prompt_tokens"),
+                func.sum(R.completion_tokens).label("completion_tokens"),
+                func.sum(R.cost_usd).label("cost_usd"),
+                func.sum(R.wall_time).label("wall_time_total"),
+                func.max(R.wall_time).label("wall_time_max"),
+            ).group_by(R.client, R.operation)
+        )).all()
+        recent = (await db.execute(
+            select(R.client, R.operation, R.wall_time).order_by(R.id.desc()).limit(self.percentile_sample)
+        )).all()
+
+        total = EvalAggregate()
+        by_client: Dict[str, EvalAggregate] = {}
+        by_operation: Dict[str, EvalAggregate] = {}
+        by_client_operation: Dict[str, EvalAggregate] = {}
+
+        def aggregates(client: Optional[str], operation: str) -> List[EvalAggregate]:
+            client = client or "unknown"
+            return [
+                total,
+                by_client.setdefault(client, EvalAggregate()),
+                by_operation.setdefault(operation, EvalAggregate()),
+                by_client_operation.setdefault(f"{client}:{operation}", EvalAggregate()),
+            ]
+
+        for row in groups:
+            for aggregate in aggregates(row.client, row.operation):
+                aggregate.add_totals(row)
+        for row in recent:
+            for aggregate in aggregates(row.client, row.operation):
+                aggregate.recent_wall_times.append(row.wall_time)
+
+        return {
+            "total": total.to_dict(),
+            "by_client": {k: v.to_dict() for k, v in by_client.items()},
+            "by_operation": {k: v.to_dict() for k, v in by_operation.items()},
+            "by_client_operation": {k: v.to_dict() for k, v in by_client_operation.items()},
+        }
+
+
+eval_metrics = EvalMetricsStore(
+    flush_interval=float(os.getenv("EVAL_METRICS_FLUSH_SECONDS", "5")),
+    file_path=os.getenv("EVAL_METRICS_FILE"),
+)
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    pricing = None
+    for name, prices in MODEL_PRICING_PER_1M.items():
+        # Dated snapshots (e.g. gpt-4o-mini-2024-07-18) are priced like their base model
+        if model and model.startswith(name) and (pricing is None or len(name) > len(pricing[0])):
+            pricing = (name, prices)
+    if pricing is None:
+        return 0.0
+    prompt_price, completion_price = pricing[1]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+@contextmanager
+def eval_scope(call_id: Optional[str], client: Optional[str]):
+    """Attribute eval work done inside this block to a call and client."""
+    token = _eval_scope.set({"call_id": call_id, "client": client})
+    try:
+        yield
+    finally:
+        _eval_scope.reset(token)
+
+
+class EvalTracker:
+    """Collects usage from every completion made for one eval invocation."""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.model: Optional[str] = None
+        self.attempts = 0
+        self.resends = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.success = True
+
+    def add_response(self, response):
+        self.attempts += 1
+        self.model = getattr(response, "model", None) or self.model
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+
+def note_resend():
+    """Count a completion of the current eval that had to be sent again (e.g. after a 429)."""
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.resends += 1
+
+
+@contextmanager
+def track_eval(operation: str, model: Optional[str] = None):
+    """
+    Time an eval invocation and record its token usage, model and retries
+    (repair attempts plus completions re-sent after a rate limit).
+
+    Usage:
+        with track_eval("call_summary") as tracker:
+            response = client.chat.completions.create(...)
+            tracker.add_response(response)
+    """
+    tracker = EvalTracker(operation)
+    tracker.model = model
+    scope = _eval_scope.get()
+    tracker_token = _current_tracker.set(tracker)
+    start = time.perf_counter()
+    try:
+        yield tracker
+    except Exception:
+        tracker.success = False
+        raise
+    finally:
+        _current_tracker.reset(tracker_token)
+        wall_time = time.perf_counter() - start
+        if tracker.model != "local":
+            record_span("llm", wall_time)
+        eval_metrics.add(EvalRecord(
+            timestamp=time.time(),
+            call_id=scope.get("call_id"),
+            client=scope.get("client"),
+            operation=operation,
+            model=tracker.model,
+            prompt_tokens=tracker.prompt_tokens,
+            completion_tokens=tracker.completion_tokens,
+            wall_time=wall_time,
+            retries=max(0, tracker.attempts - 1) + tracker.resends,
+            cost_usd=estimate_cost(tracker.model, tracker.prompt_tokens, tracker.completion_tokens),
+            success=tracker.success,
+        ))
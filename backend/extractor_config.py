@@ -48,4 +48,4 @@ need_conversation_eval = ['shunya'] #Conversation Evaluation based on clarity, c
 
 skip_db_search = ['azent', "sbi"] #Skip DB search for conversation_eval and entity extraction.
 
-regenerate_summaries = [] #Regenerate  the summary and save it in db.
\ No newline at end of file
+regenerate_summaries = [] #Regenerate  the summary and save it in db.
@@ -0,0 +1,106 @@
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+CONFIDENCE_LEVELS = ["high", "medium", "low", "NA"]
+
+EXTRACTION_PROMPT_HEADER = """
+You are an intelligent entity extraction system. Given a conversation transcript, extract the following fields ONLY based on what the USER says.
+
+Ignore the interviewer, assistant, or system. Focus only on USER responses.
+
+Here are the fields to extract:
+"""
+
+EXTRACTION_PROMPT_RULES = """
+Rules:
+- "text": the actual user quote where the information is mentioned
+- "value": cleaned, structured value
+- "confidence": "high", "medium", "low" depending on clarity of user speech
+- If the user does not mention something, return:
+  { "text": "NA", "value": "Not Mentioned", "confidence": "NA" }
+- Do NOT include commentary. Only return valid JSON.
+Transcript:
+"""
+
+ENTITY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string"},
+        "value": {"type": "string"},
+        "confidence": {"type": "string", "enum": CONFIDENCE_LEVELS},
+    },
+    "required": ["text", "value", "confidence"],
+    "additionalProperties": False,
+}
+
+
+@dataclass(frozen=True)
+class CompiledExtractor:
+    """Prompt and JSON schema for one set of extraction fields, built once"""
+    field_names: Tuple[str, ...]
+    prompt_prefix: str
+    response_format: Dict[str, Any]
+
+    def render_prompt(self, transcript: str) -> str:
+        return f"{self.prompt_prefix}{transcript}\n"
+
+    def validate(self, data: Any) -> List[str]:
+        """Return a list of problems with an extraction result, empty if it is valid."""
+        if not isinstance(data, dict):
+            return ["the reply must be a JSON object"]
+        errors = []
+        for field in self.field_names:
+            entity = data.get(field)
+            if not isinstance(entity, dict):
+                errors.append(f'"{field}" is missing or not an object')
+                continue
+            for key in ("text", "value", "confidence"):
+                if not isinstance(entity.get(key), str):
+                    errors.append(f'"{field}.{key}" must be a string')
+        return errors
+
+
+@lru_cache(maxsize=256)
+def _compile(fields: Tuple[Tuple[str, str], ...]) -> CompiledExtractor:
+    field_names = tuple(field for field, _ in fields)
+
+    field_instructions = "\n".join(
+        [f"{i+1}. {field}: {desc}" for i, (field, desc) in enumerate(fields)]
+    )
+    json_template = ",\n".join(
+        [f'{json.dumps(field)}: {{"text": "...", "value": "...", "confidence": "..."}}' for field in field_names]
+    )
+    prompt_prefix = (
+        EXTRACTION_PROMPT_HEADER
+        + field_instructions
+        + "\n\nReturn a JSON object in the following format:\n{\n"
+        + json_template
+        + "\n}\n"
+        + EXTRACTION_PROMPT_RULES
+    )
+
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "entity_extraction",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {field: ENTITY_SCHEMA for field in field_names},
+                "required": list(field_names),
+                "additionalProperties": False,
+            },
+        },
+    }
+    return CompiledExtractor(field_names=field_names, prompt_prefix=prompt_prefix, response_format=response_format)
+
+
+def get_compiled_extractor(fields: list[tuple[str, str]]) -> CompiledExtractor:
+    """
+    Compiled prompt/schema for a field list. Built lazily on first use and
+    cached, so each set (usually the fields left after local extraction) is
+    built only once.
+    """
+    return _compile(tuple((field, desc) for field, desc in fields))
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from livekit import api
+
+logger = logging.getLogger("livekit-dispatch")
+
+
+@dataclass
+class DispatchResult:
+    """Outcome of dispatching an agent into a new room"""
+    success: bool
+    room_id: Optional[str] = None
+    dispatch_id: Optional[str] = None
+    agent_name: Optional[str] = None
+    output: Optional[str] = None
+    error: Optional[str] = None
+    latency: float = 0.0
+
+
+class LiveKitDispatcher:
+    """
+    Application-scoped agent dispatcher backed by one pooled LiveKitAPI client.
+
+    Call `start()` once the event loop is running (the underlying aiohttp
+    session must be created inside it) and `close()` on shutdown.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_secret: Optional[str] = None,
+        room_prefix: str = "call-",
+    ):
+        self.url = url or os.getenv("LIVEKIT_URL")
+        self.api_key = api_key or os.getenv("LIVEKIT_API_KEY")
+        self.api_secret = api_secret or os.getenv("LIVEKIT_API_SECRET")
+        self.room_prefix = room_prefix
+        self._api: Optional[api.LiveKitAPI] = None
+
+    @property
+    def client(self) -> api.LiveKitAPI:
+        if self._api is None:
+            raise RuntimeError("LiveKitDispatcher.start() has not been called")
+        return self._api
+
+    async def start(self):
+        if self._api is None:
+            self._api = api.LiveKitAPI(self.url, self.api_key, self.api_secret)
+
+    async def close(self):
+        if self._api is not None:
+            await self._api.aclose()
+            self._api = None
+
+    def new_room_name(self) -> str:
+        return f"{self.room_prefix}{uuid.uuid4().hex[:12]}"
+
+    async def dispatch(self, agent_name: str, metadata: Dict[str, Any], room_name: Optional[str] = None) -> DispatchResult:
+        """
+        Dispatch `agent_name` into `room_name` (a fresh room if not given).
+
+        `metadata` is sent as JSON; the agent reads the number to dial from its
+        "phone" key (livekit-agent-custom/agent.py parse_phone_number, which
+        still accepts a bare number from older dispatchers).
+        """
+        room = room_name or self.new_room_name()
+        start = time.perf_counter()
+        try:
+            await self.start()
+            dispatch = await self.client.agent_dispatch.create_dispatch(
+                api.CreateAgentDispatchRequest(
+                    agent_name=agent_name,
+                    room=room,
+                    metadata=json.dumps(metadata),
+                )
+            )
+            return DispatchResult(
+                success=True,
+                room_id=dispatch.room or room,
+                dispatch_id=dispatch.id,
+                agent_name=dispatch.agent_name or agent_name,
+                output=f'Dispatch created: id:"{dispatch.id}" room:"{dispatch.room or room}"',
+                latency=time.perf_counter() - start,
+            )
+        except Exception as e:
+            logger.error(f"Failed to dispatch {agent_name} to room {room}: {e}")
+            return DispatchResult(
+                success=False,
+                room_id=room,
+                agent_name=agent_name,
+                error=str(e),
+                latency=time.perf_counter() - start,
+            )
+
+
+async def cli_dispatch(agent_name: str, metadata: Dict[str, Any], contact_number: str) -> DispatchResult:
+    """
+    Legacy dispatch through the `lk` CLI subprocess (utils.call.run_livekit_dispatch).
+
+    Kept for DISPATCH_MODE=cli and for benchmarking against the native client.
+    Runs in a worker thread so the subprocess no longer blocks the event loop.
+    """
+    from utils.call import run_livekit_dispatch
+
+    start = time.perf_counter()
+    result = await asyncio.to_thread(
+        run_livekit_dispatch,
+        metadata=metadata,
+        contact_number=contact_number,
+        agent_name=agent_name,
+    )
+    latency = time.perf_counter() - start
+    if not result["success"]:
+        return DispatchResult(success=False, agent_name=agent_name, error=result.get("error"), latency=latency)
+
+    # Extract room ID
+    room_match = re.search(r'room:"(.*?)"', result["output"] or "")
+    dispatch_match = re.search(r'id:"(.*?)"', result["output"] or "")
+    if not room_match:
+        # Without the room there is no call record to attach, and no lease to move to it
+        logger.error(f"lk dispatch output has no room id: {result['output']!r}")
+        return DispatchResult(
+            success=False,
+            agent_name=agent_name,
+            output=result["output"],
+            error="Dispatch created but its room id could not be read",
+            latency=latency,
+        )
+    return DispatchResult(
+        success=True,
+        room_id=room_match.group(1),
+        dispatch_id=dispatch_match.group(1) if dispatch_match else None,
+        agent_name=agent_name,
+        output=result["output"],
+        latency=latency,
+    )
@@ -0,0 +1,242 @@
+"""
+LiveKit webhook ingestion for the call lifecycle.
+
+LiveKit posts room_started, room_finished, participant_left and
+egress_ended events, signed with the API key/secret. Each one is applied to
+the Call row of its room (rooms are named after call_id) exactly once:
+
+- the event id is recorded in livekit_webhook_events, so redeliveries are
+  dropped;
+- every transition is a conditional UPDATE on call_lifecycle (e.g. only
+  while room_finished_at IS NULL), so a room_finished arriving after the
+  callee's participant_left does not end the call twice.
+
+Once a call row carries call_ended_at, reads use it directly instead of
+reconstructing status and times from the rooms store.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, case, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.db_test.db import Base
+from database.db_test import models
+
+logger = logging.getLogger("livekit-webhooks")
+
+EVENT_ROOM_STARTED = "room_started"
+EVENT_ROOM_FINISHED = "room_finished"
+EVENT_PARTICIPANT_LEFT = "participant_left"
+EVENT_EGRESS_ENDED = "egress_ended"
+HANDLED_EVENTS = (EVENT_ROOM_STARTED, EVENT_ROOM_FINISHED, EVENT_PARTICIPANT_LEFT, EVENT_EGRESS_ENDED)
+
+# ParticipantInfo.Kind.SIP: the callee's leg of the call
+PARTICIPANT_KIND_SIP = 3
+# call_status values a finished call may overwrite; outcomes reported by the agent are kept
+OPEN_CALL_STATUSES = ("Ongoing", "started")
+
+
+class LiveKitWebhookEvent(Base):
+    """Ids of webhook events already applied, for idempotent redelivery."""
+    __tablename__ = "livekit_webhook_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String, unique=True, nullable=False)
+    event = Column(String, nullable=False)
+    room_name = Column(String, index=True, nullable=True)
+    received_at = Column(DateTime, default=datetime.now)
+
+
+class CallLifecycle(Base):
+    """Room-level state of a call as reported by LiveKit, one row per call_id."""
+    __tablename__ = "call_lifecycle"
+
+    id = Column(Integer, primary_key=True, index=True)
+    call_id = Column(String, unique=True, nullable=False)
+    room_sid = Column(String, nullable=True)
+    room_started_at = Column(DateTime, nullable=True)
+    room_finished_at = Column(DateTime, nullable=True)
+    recording_key = Column(String, nullable=True)
+    post_call_at = Column(DateTime, nullable=True)  # post-call evaluation completed
+
+
+class WebhookVerifier:
+    """Checks the Authorization JWT (and the body hash it carries) of a webhook request."""
+
+    def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None):
+        from livekit import api
+
+        self.receiver = api.WebhookReceiver(api.TokenVerifier(
+            api_key or os.getenv("LIVEKIT_API_KEY"),
+            api_secret or os.getenv("LIVEKIT_API_SECRET"),
+        ))
+
+    def receive(self, body: bytes, authorization: str):
+        """The parsed WebhookEvent; raises if the signature or body hash is invalid."""
+        return self.receiver.receive(body.decode("utf-8"), authorization)
+
+
+def _timestamp(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds) if seconds else datetime.now()
+
+
+async def _record_event(db: AsyncSession, call_id: str, event) -> bool:
+    """False if this event id was applied before."""
+    try:
+        async with db.begin_nested():
+            db.add(LiveKitWebhookEvent(event_id=event.id, event=event.event, room_name=call_id))
+        return True
+    except IntegrityError:
+        return False
+
+
+async def _ensure_lifecycle(db: AsyncSession, call_id: str):
+    exists = (await db.execute(select(CallLifecycle.id).where(CallLifecycle.call_id == call_id))).first()
+    if exists is None:
+        try:
+            async with db.begin_nested():
+                db.add(CallLifecycle(call_id=call_id))
+        except IntegrityError:
+            pass  # created by a concurrent delivery
+
+
+async def _room_started(db: AsyncSession, call_id: str, event) -> bool:
+    started_at = _timestamp(event.room.creation_time or event.created_at)
+    changed = (await db.execute(
+        update(CallLifecycle)
+        .where(CallLifecycle.call_id == call_id, CallLifecycle.room_started_at.is_(None))
+        .values(room_started_at=started_at, room_sid=event.room.sid or None)
+    )).rowcount
+    if changed:
+        await db.execute(
+            update(models.Call)
+            .where(models.Call.call_id == call_id)
+            .values(
+                call_started_at=started_at,
+                call_status=case(
+                    (models.Call.call_status.is_(None), "Ongoing"),
+                    else_=models.Call.call_status,
+                ),
+            )
+        )
+    return False
+
+
+async def _call_finished(db: AsyncSession, call_id: str, event) -> bool:
+    ended_at = _timestamp(event.created_at)
+    changed = (await db.execute(
+        update(CallLifecycle)
+        .where(CallLifecycle.call_id == call_id, CallLifecycle.room_finished_at.is_(None))
+        .values(room_finished_at=ended_at)
+    )).rowcount
+    if not changed:
+        return False
+
+    started_at = (await db.execute(
+        select(CallLifecycle.room_started_at).where(CallLifecycle.call_id == call_id)
+    )).scalar()
+    if started_at is None:
+        started_at = (await db.execute(
+            select(models.Call.call_started_at).where(models.Call.call_id == call_id)
+        )).scalar()
+    duration_ms = int((ended_at - started_at).total_seconds() * 1000) if started_at else 0
+
+    await db.execute(
+        update(models.Call)
+        .where(models.Call.call_id == call_id)
+        .values(
+            call_ended_at=ended_at,
+            call_duration=max(0, duration_ms),
+            call_status=case(
+                (models.Call.call_status.is_(None), "ended"),
+                (models.Call.call_status.in_(OPEN_CALL_STATUSES), "ended"),
+                else_=models.Call.call_status,
+            ),
+        )
+    )
+    return True
+
+
+async def _egress_ended(db: AsyncSession, call_id: str, event) -> bool:
+    info = event.egress_info
+    files = list(info.file_results) or ([info.file] if info.HasField("file") else [])
+    # filename is the object key; location is a full URL, not something to fetch from S3 by
+    key = next((f.filename for f in files if f.filename), None)
+    if key:
+        await db.execute(
+            update(CallLifecycle)
+            .where(CallLifecycle.call_id == call_id, CallLifecycle.recording_key.is_(None))
+            .values(recording_key=key)
+        )
+    return False
+
+
+def event_call_id(event) -> Optional[str]:
+    if event.event == EVENT_EGRESS_ENDED:
+        return event.egress_info.room_name
+    return event.room.name
+
+
+async def webhook_call_user(db: AsyncSession, event) -> Optional[int]:
+    """user_id of the call an event is about (None if it is not about a known call)."""
+    if event.event not in HANDLED_EVENTS:
+        return None
+    call_id = event_call_id(event)
+    if not call_id:
+        return None
+    return (await db.execute(select(models.Call.user_id).where(models.Call.call_id == call_id))).scalar()
+
+
+async def apply_webhook_event(db: AsyncSession, event) -> Optional[str]:
+    """
+    Apply one verified event and commit. Returns the call_id when this event
+    is the one that ended the call, so post-call work is started only once.
+    """
+    if event.event not in HANDLED_EVENTS:
+        return None
+    call_id = event_call_id(event)
+    if event.event == EVENT_PARTICIPANT_LEFT and event.participant.kind != PARTICIPANT_KIND_SIP:
+        # Only the callee hanging up ends the call; the agent leaving is followed by room_finished
+        return None
+    if not call_id:
+        return None
+
+    if not await _record_event(db, call_id, event):
+        logger.info(f"Skipping duplicate webhook {event.id} ({event.event}) for {call_id}")
+        await db.rollback()
+        return None
+
+    await _ensure_lifecycle(db, call_id)
+    handler = {
+        EVENT_ROOM_STARTED: _room_started,
+        EVENT_ROOM_FINISHED: _call_finished,
+        EVENT_PARTICIPANT_LEFT: _call_finished,
+        EVENT_EGRESS_ENDED: _egress_ended,
+    }[event.event]
+    finished = await handler(db, call_id, event)
+    await db.commit()
+    logger.info(f"Applied webhook {event.event} for {call_id}")
+    return call_id if finished else None
+
+
+async def mark_post_call_done(db: AsyncSession, call_id: str):
+    await db.execute(update(CallLifecycle).where(CallLifecycle.call_id == call_id).values(post_call_at=datetime.now()))
+    await db.commit()
+
+
+async def pending_post_call_ids(db: AsyncSession, finished_since: datetime, limit: int = 1000) -> List[str]:
+    """Calls that finished after `finished_since` whose post-call work never completed (e.g. lost in a restart)."""
+    return (await db.execute(
+        select(CallLifecycle.call_id)
+        .where(
+            CallLifecycle.room_finished_at.isnot(None),
+            CallLifecycle.room_finished_at >= finished_since,
+            CallLifecycle.post_call_at.is_(None),
+        )
+        .order_by(CallLifecycle.room_finished_at)
+        .limit(limit)
+    )).scalars().all()
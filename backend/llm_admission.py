@@ -0,0 +1,354 @@
+"""
+Admission control for OpenAI completions.
+
+Every completion made by openai_eval first takes one request and its
+estimated tokens from shared requests-per-minute and tokens-per-minute
+buckets. Callers that cannot be admitted wait in a priority queue, so a
+details view opened by a user goes ahead of post-call evaluations, which go
+ahead of backfills. Once the reply arrives the estimate is corrected with
+the tokens actually used.
+
+With LLM_LIMITER_REDIS_URL set, the buckets live in Redis and are shared by
+every worker (the priority queue stays per process), and so is the pause
+after a 429. If Redis is unreachable the local buckets are used.
+
+The priority of the work is taken from a contextvar:
+
+    with llm_priority(PRIORITY_BATCH):
+        await call_summary(transcript)
+
+The block yields its LLMWork; raising its priority (e.g. once a user is
+waiting on the same result) also moves its already-queued calls up:
+
+    llm_limiter.raise_priority(work, PRIORITY_INTERACTIVE)
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("llm-admission")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_POST_CALL = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_POST_CALL: "post_call", PRIORITY_BATCH: "batch"}
+
+# Refills both buckets from Redis server time and takes the request only if both have room.
+# Returns 0 when admitted, else milliseconds until there will be room (or the 429 pause ends).
+ACQUIRE_SCRIPT = """
+local paused = redis.call('PTTL', KEYS[3])
+if paused > 0 then
+    return paused
+end
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local need = {1, tonumber(ARGV[3])}
+local limits = {tonumber(ARGV[1]), tonumber(ARGV[2])}
+local levels = {}
+local wait = 0
+for i = 1, 2 do
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or limits[i]
+    local ts = tonumber(state[2]) or now
+    local rate = limits[i] / 60
+    tokens = math.min(limits[i], tokens + (now - ts) * rate)
+    levels[i] = tokens
+    local wanted = math.min(need[i], limits[i])
+    if tokens < wanted then
+        wait = math.max(wait, (wanted - tokens) / rate)
+    end
+end
+if wait > 0 then
+    for i = 1, 2 do
+        redis.call('HSET', KEYS[i], 'tokens', levels[i], 'ts', now)
+        redis.call('EXPIRE', KEYS[i], 120)
+    end
+    return math.ceil(wait * 1000)
+end
+for i = 1, 2 do
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - need[i], 'ts', now)
+    redis.call('EXPIRE', KEYS[i], 120)
+end
+return 0
+"""
+
+ADJUST_SCRIPT = """
+redis.call('HINCRBYFLOAT', KEYS[1], 'tokens', ARGV[1])
+return 0
+"""
+
+# Extends the shared pause to at least ARGV[1] milliseconds from now
+PAUSE_SCRIPT = """
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], 1, 'PX', ARGV[1])
+end
+return 0
+"""
+
+
+class LLMWork:
+    """The priority shared by the LLM calls of one piece of work."""
+    __slots__ = ("priority",)
+
+    def __init__(self, priority: int):
+        self.priority = priority
+
+
+_llm_work: contextvars.ContextVar[Optional[LLMWork]] = contextvars.ContextVar("llm_work", default=None)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """Queue LLM calls made inside this block with `priority`; yields the block's LLMWork."""
+    work = LLMWork(priority)
+    token = _llm_work.set(work)
+    try:
+        yield work
+    finally:
+        _llm_work.reset(token)
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Rough prompt size (~4 characters per token) plus the completion budget."""
+    prompt_chars = sum(len(str(message.get("content") or "")) for message in messages)
+    return prompt_chars // 4 + (max_tokens or 500)
+
+
+class _LocalBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` (capped at capacity) is available."""
+        self.refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ("priority", "work", "tokens", "future", "enqueued")
+
+    def __init__(self, priority: int, work: Optional[LLMWork], tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.work = work
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class LLMAdmissionLimiter:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 redis_url: Optional[str] = None, namespace: str = "llm"):
+        self.requests = _LocalBucket(requests_per_minute)
+        self.tokens = _LocalBucket(tokens_per_minute)
+        self.redis_url = redis_url
+        self.keys = [
+            f"llm-admission:{namespace}:requests",
+            f"llm-admission:{namespace}:tokens",
+            f"llm-admission:{namespace}:paused",
+        ]
+        self._redis = None
+        self._heap: List[Any] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+        self.admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.rate_limited = 0
+        self.wait_times = {name: deque(maxlen=1000) for name in PRIORITY_NAMES.values()}
+
+    @classmethod
+    def from_env(cls) -> "LLMAdmissionLimiter":
+        return cls(
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500")),
+            tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000")),
+            redis_url=os.getenv("LLM_LIMITER_REDIS_URL"),
+        )
+
+    async def _get_redis(self):
+        if not self.redis_url:
+            return None
+        if self._redis is None:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(self.redis_url)
+            except ImportError:
+                logger.error("Redis not available. Install redis with: pip install redis")
+                self.redis_url = None
+                return None
+        return self._redis
+
+    async def acquire(self, tokens: int, priority: Optional[int] = None):
+        """Wait until one request of ~`tokens` tokens may be sent."""
+        work = _llm_work.get() if priority is None else None
+        if priority is None:
+            priority = work.priority if work is not None else PRIORITY_INTERACTIVE
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._sequence), _Waiter(priority, work, tokens, future)))
+        self._ensure_running()
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Leave a cancelled waiter in the heap; the dispatcher skips it
+            raise
+
+    def record_usage(self, estimated: int, actual: Optional[int]):
+        """Correct the tokens bucket by what the completion really used."""
+        if actual is None:
+            return
+        delta = estimated - actual
+        self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens + delta)
+        if self.redis_url and self._redis is not None:
+            asyncio.ensure_future(self._adjust_redis(delta))
+
+    def raise_priority(self, work: LLMWork, priority: int):
+        """Move `work`, and its calls already waiting, up to `priority`."""
+        if priority >= work.priority:
+            return
+        work.priority = priority
+        for _, _, waiter in list(self._heap):
+            if waiter.work is work and not waiter.future.done() and waiter.priority > priority:
+                # The old entry is skipped once its waiter's priority no longer matches it
+                waiter.priority = priority
+                heapq.heappush(self._heap, (priority, next(self._sequence), waiter))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def backoff(self, seconds: float):
+        """Hold every queue (of every worker, with Redis) after OpenAI answered 429."""
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.redis_url:
+            asyncio.ensure_future(self._pause_redis(seconds))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def metrics(self) -> Dict[str, Any]:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for entry in self._heap:
+            if not self._stale(entry):
+                depth[PRIORITY_NAMES.get(entry[0], "batch")] += 1
+
+        def stats(values) -> Dict[str, float]:
+            ordered = sorted(values)
+            if not ordered:
+                return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+            return {
+                "avg": round(sum(ordered) / len(ordered), 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+                "max": round(ordered[-1], 3),
+            }
+
+        self.requests.refill()
+        self.tokens.refill()
+        return {
+            "queue_depth": depth,
+            "wait_time": {name: stats(values) for name, values in self.wait_times.items()},
+            "admitted": dict(self.admitted),
+            "rate_limited": self.rate_limited,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            "requests_available": round(self.requests.tokens, 1),
+            "tokens_available": round(self.tokens.tokens),
+            "shared": bool(self.redis_url),
+        }
+
+    @staticmethod
+    def _stale(entry) -> bool:
+        """A heap entry whose waiter is done, or was re-queued at a raised priority."""
+        priority, _, waiter = entry
+        return waiter.future.done() or waiter.priority != priority
+
+    def _ensure_running(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self):
+        """Admit the highest-priority waiter as soon as the buckets have room for it."""
+        while True:
+            while self._heap and self._stale(self._heap[0]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            waiter = self._heap[0][2]
+            wait = max(self._paused_until - time.monotonic(), 0.0)
+            if not wait:
+                wait = await self._try_take(waiter.tokens)
+            if wait:
+                # A higher-priority arrival or a 429 wakes us up early to re-evaluate
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            if waiter.future.done():
+                continue
+            name = PRIORITY_NAMES.get(waiter.priority, "batch")
+            self.admitted[name] += 1
+            self.wait_times[name].append(time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    async def _try_take(self, tokens: int) -> float:
+        """0 if the request was taken from the buckets, else seconds to wait."""
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                wait_ms = await redis.eval(
+                    ACQUIRE_SCRIPT, 3, *self.keys,
+                    self.requests.capacity, self.tokens.capacity, tokens,
+                )
+                if not wait_ms:
+                    # Mirror locally for metrics and for the fallback if Redis goes away
+                    self.requests.tokens -= 1
+                    self.tokens.tokens -= tokens
+                return int(wait_ms) / 1000
+            except Exception as e:
+                logger.warning(f"Redis LLM limiter unavailable, using local buckets: {e}")
+
+        wait = max(self.requests.wait_for(1), self.tokens.wait_for(tokens))
+        if wait:
+            return wait
+        self.requests.tokens -= 1
+        self.tokens.tokens -= tokens
+        return 0.0
+
+    async def _pause_redis(self, seconds: float):
+        redis = await self._get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.eval(PAUSE_SCRIPT, 1, self.keys[2], max(1, int(seconds * 1000)))
+        except Exception as e:
+            logger.warning(f"Failed to share LLM rate limit pause: {e}")
+
+    async def _adjust_redis(self, delta: float):
+        try:
+            await self._redis.eval(ADJUST_SCRIPT, 1, self.keys[1], delta)
+        except Exception as e:
+            logger.warning(f"Failed to adjust shared token bucket: {e}")
+
+
+llm_limiter = LLMAdmissionLimiter.from_env()
@@ -0,0 +1,248 @@
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Local matches below this score are left for the LLM to resolve
+LOCAL_MIN_CONFIDENCE = float(os.getenv("LOCAL_EXTRACTION_MIN_CONFIDENCE", "0.8"))
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "a": 1, "an": 1, "single": 1,
+}
+
+MONTHS = {
+    "jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3,
+    "apr": 4, "april": 4, "may": 5, "jun": 6, "june": 6, "jul": 7, "july": 7,
+    "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9, "oct": 10,
+    "october": 10, "nov": 11, "november": 11, "dec": 12, "december": 12,
+}
+
+# Month names that are also common words ("may 3 people come", "mar the plan")
+AMBIGUOUS_MONTHS = {"may", "mar"}
+
+_NUMBER = r"(\d{1,2}|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+_MONTH = r"(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")"
+
+USER_PREFIX_RE = re.compile(r"^\s*(user|you)\s*:\s*", re.IGNORECASE)
+SPEAKER_RE = re.compile(r"^\s*[A-Za-z_ ]{1,20}:\s*")
+PHONE_RE = re.compile(r"(?<![\d])\+?\d[\d\s\-]{7,16}\d(?![\d])")
+YEAR_RE = re.compile(r"\b(19[5-9]\d|20\d{2})\b")
+SEATS_RE = re.compile(r"\b" + _NUMBER + r"\s+(?:tickets?|seats?|people|persons?|passengers?|adults?)\b", re.IGNORECASE)
+SEATS_SOLO_RE = re.compile(r"\b(?:just|only)\s+(?:me|myself)\b|\bmyself\s+alone\b", re.IGNORECASE)
+NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4}|\d{2})\b")
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r"\b(?:,?\s+(\d{4}))?", re.IGNORECASE)
+MONTH_DAY_RE = re.compile(r"\b" + _MONTH + r"\s+(\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(\d{4}))?", re.IGNORECASE)
+RELATIVE_DATE_RE = re.compile(r"\b(today|tomorrow|day after tomorrow|next\s+\w+day|this\s+\w+day)\b", re.IGNORECASE)
+ROUND_TRIP_RE = re.compile(r"\b(round[\s\-]?trip|return ticket|two[\s\-]?way|both ways|coming back)\b", re.IGNORECASE)
+ONE_WAY_RE = re.compile(r"\b(one[\s\-]?way|single journey|no return)\b", re.IGNORECASE)
+NOTICE_RE = re.compile(r"\b" + _NUMBER + r"\s*(days?|weeks?|months?)\b", re.IGNORECASE)
+DATE_CONTEXT_RE = re.compile(r"\b(date|day|when|travel\w*|fly\w*|flight|depart\w*|leav\w*|journey|book\w*)\b", re.IGNORECASE)
+IMMEDIATE_RE = re.compile(r"\b(immediate(?:ly)?|no notice period|serving notice|already resigned)\b", re.IGNORECASE)
+
+
+@dataclass
+class Turn:
+    """A USER utterance together with the line spoken just before it"""
+    question: str
+    text: str
+
+
+@dataclass
+class LocalMatch:
+    text: str
+    value: str
+    score: float
+
+
+def user_turns(transcript: str) -> List[Turn]:
+    """Split a transcript into USER turns, keeping the preceding agent line as context."""
+    turns = []
+    previous = ""
+    for line in transcript.split("\n"):
+        if not line.strip():
+            continue
+        if USER_PREFIX_RE.match(line):
+            turns.append(Turn(question=previous, text=USER_PREFIX_RE.sub("", line).strip()))
+        else:
+            previous = SPEAKER_RE.sub("", line).strip()
+    return turns
+
+
+def _to_number(token: str) -> Optional[int]:
+    token = token.lower()
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def _single(matches: List[LocalMatch], ambiguous_score: float = 0.4) -> Optional[LocalMatch]:
+    """Return the match if all candidates agree on one value, else a low-confidence one."""
+    if not matches:
+        return None
+    values = {m.value for m in matches}
+    best = max(matches, key=lambda m: m.score)
+    if len(values) > 1:
+        return LocalMatch(text=best.text, value=best.value, score=min(best.score, ambiguous_score))
+    return best
+
+
+def parse_mobile_number(turns: List[Turn]) -> Optional[LocalMatch]:
+    matches = []
+    for turn in turns:
+        for raw in PHONE_RE.findall(turn.text):
+            digits = re.sub(r"\D", "", raw)
+            if not 9 <= len(digits) <= 13:
+                continue
+            asked = re.search(r"\b(mobile|phone|number|contact|whatsapp)\b", turn.question, re.IGNORECASE)
+            # Digits split into groups ("150000 200000") are only a phone number when one was asked for
+            if not asked and re.search(r"[\s\-]", raw.strip()):
+                continue
+            value = ("+" if raw.strip().startswith("+") else "") + digits
+            matches.append(LocalMatch(text=turn.text, value=value, score=0.95 if asked else 0.85))
+    return _single(matches)
+
+
+def parse_year(turns: List[Turn]) -> Optional[LocalMatch]:
+    matches = []
+    max_year = datetime.now().year + 1
+    for turn in turns:
+        for year in YEAR_RE.findall(turn.text):
+            if int(year) > max_year:
+                continue
+            asked = re.search(r"\b(year|model|make|manufactur\w*|bought|purchased)\b", turn.question, re.IGNORECASE)
+            matches.append(LocalMatch(text=turn.text, value=year, score=0.9 if asked else 0.7))
+    return _single(matches)
+
+
+def parse_seat_count(turns: List[Turn]) -> Optional[LocalMatch]:
+    matches = []
+    for turn in turns:
+        for token in SEATS_RE.findall(turn.text):
+            count = _to_number(token)
+            if count:
+                matches.append(LocalMatch(text=turn.text, value=str(count), score=0.9))
+        if SEATS_SOLO_RE.search(turn.text):
+            matches.append(LocalMatch(text=turn.text, value="1", score=0.8))
+    return _single(matches)
+
+
+def _build_date(year: Optional[int], month: int, day: int) -> Optional[Tuple[date, bool]]:
+    """Build a date, inferring the next occurrence when the year is not spoken."""
+    today = date.today()
+    try:
+        if year is not None:
+            return date(year if year > 100 else 2000 + year, month, day), True
+        candidate = date(today.year, month, day)
+        if candidate < today:
+            candidate = date(today.year + 1, month, day)
+        return candidate, False
+    except ValueError:
+        return None
+
+
+def _is_month(token: str, turn: Turn) -> bool:
+    """"May"/"Mar" count as months when capitalised or when the turn is about a date."""
+    if token.lower() not in AMBIGUOUS_MONTHS or token[0].isupper():
+        return True
+    return bool(DATE_CONTEXT_RE.search(turn.question) or DATE_CONTEXT_RE.search(turn.text))
+
+
+def parse_travel_date(turns: List[Turn]) -> Optional[LocalMatch]:
+    matches = []
+    for turn in turns:
+        found = []
+        for y, m, d in ISO_DATE_RE.findall(turn.text):
+            found.append(_build_date(int(y), int(m), int(d)))
+        for d, m, y in NUMERIC_DATE_RE.findall(turn.text):
+            found.append(_build_date(int(y), int(m), int(d)))
+        for d, m, y in DAY_MONTH_RE.findall(turn.text):
+            if _is_month(m, turn):
+                found.append(_build_date(int(y) if y else None, MONTHS[m.lower()], int(d)))
+        for m, d, y in MONTH_DAY_RE.findall(turn.text):
+            if _is_month(m, turn):
+                found.append(_build_date(int(y) if y else None, MONTHS[m.lower()], int(d)))
+        for parsed in filter(None, found):
+            travel_date, explicit_year = parsed
+            matches.append(LocalMatch(text=turn.text, value=travel_date.isoformat(), score=0.95 if explicit_year else 0.85))
+        # Relative dates depend on when the call happened, so let the LLM handle them
+        if RELATIVE_DATE_RE.search(turn.text):
+            matches.append(LocalMatch(text=turn.text, value=RELATIVE_DATE_RE.search(turn.text).group(1).lower(), score=0.5))
+    return _single(matches)
+
+
+def parse_trip_type(turns: List[Turn]) -> Optional[LocalMatch]:
+    matches = []
+    for turn in turns:
+        if ROUND_TRIP_RE.search(turn.text):
+            matches.append(LocalMatch(text=turn.text, value="Round Trip", score=0.9))
+        if ONE_WAY_RE.search(turn.text):
+            matches.append(LocalMatch(text=turn.text, value="One Way", score=0.9))
+    return _single(matches)
+
+
+def parse_notice_period(turns: List[Turn]) -> Optional[LocalMatch]:
+    matches = []
+    for turn in turns:
+        asked = "notice" in turn.question.lower() or "notice" in turn.text.lower()
+        if not asked:
+            continue
+        for token, unit in NOTICE_RE.findall(turn.text):
+            count = _to_number(token)
+            if count:
+                unit = unit.lower().rstrip("s")
+                matches.append(LocalMatch(text=turn.text, value=f"{count} {unit}{'s' if count > 1 else ''}", score=0.9))
+        if IMMEDIATE_RE.search(turn.text):
+            matches.append(LocalMatch(text=turn.text, value="Immediate", score=0.85))
+    return _single(matches)
+
+
+LOCAL_PARSERS: Dict[str, Callable[[List[Turn]], Optional[LocalMatch]]] = {
+    "Mobile_Number": parse_mobile_number,
+    "Year": parse_year,
+    "Number of Seats": parse_seat_count,
+    "Travel Date": parse_travel_date,
+    "Round Trip or One Way": parse_trip_type,
+    "notice_period": parse_notice_period,
+}
+
+
+def confidence_label(score: float) -> str:
+    return "high" if score >= 0.9 else "medium" if score >= 0.7 else "low"
+
+
+def extract_local_entities(
+    transcript: str,
+    fields: list[tuple[str, str]],
+    min_confidence: float = LOCAL_MIN_CONFIDENCE,
+) -> Tuple[dict, list[tuple[str, str]]]:
+    """
+    Resolve pattern-friendly fields from USER turns without calling the LLM.
+
+    Returns:
+        (resolved, unresolved): entities in the LLM output format, and the
+        (field, description) pairs that still need the LLM.
+    """
+    turns = None
+    resolved = {}
+    unresolved = []
+    for field, desc in fields or []:
+        parser = LOCAL_PARSERS.get(field)
+        if parser is None:
+            unresolved.append((field, desc))
+            continue
+        if turns is None:
+            turns = user_turns(transcript)
+        match = parser(turns)
+        if match is None or match.score < min_confidence:
+            unresolved.append((field, desc))
+            continue
+        resolved[field] = {
+            "text": match.text,
+            "value": match.value,
+            "confidence": confidence_label(match.score),
+        }
+    return resolved, unresolved
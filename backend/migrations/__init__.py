@@ -0,0 +1,77 @@
+"""
+Schema migrations applied on top of Base.metadata.create_all.
+
+create_all only creates missing tables, so anything added to an existing table
+(indexes, constraints) lives here as a numbered migration. Applied versions are
+recorded in `schema_migrations`; each migration runs once, in order, inside its
+own transaction.
+
+    python -m backend.migrations upgrade      # apply pending migrations, then check-plans
+    python -m backend.migrations status       # list applied / pending
+    python -m backend.migrations check-plans  # EXPLAIN the hot queries, exit 1 on a plan regression
+"""
+import logging
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import m0001_hot_path_indexes, m0002_transcript_search
+
+logger = logging.getLogger("migrations")
+
+# In order; append new migration modules here
+MIGRATIONS = [
+    m0001_hot_path_indexes,
+    m0002_transcript_search,
+]
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String, primary_key=True),
+    Column("description", String, nullable=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _lock(conn: Connection):
+    # Several uvicorn workers may start at once; serialize them on Postgres
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+
+
+def applied_versions(engine: Engine) -> List[str]:
+    _metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return [row.version for row in conn.execute(select(schema_migrations.c.version))]
+
+
+def pending_migrations(engine: Engine):
+    applied = set(applied_versions(engine))
+    return [m for m in MIGRATIONS if m.VERSION not in applied]
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """Apply pending migrations; returns the versions applied."""
+    _metadata.create_all(bind=engine)
+    done = []
+    for migration in MIGRATIONS:
+        with engine.begin() as conn:
+            _lock(conn)
+            already = conn.execute(
+                select(schema_migrations.c.version).where(schema_migrations.c.version == migration.VERSION)
+            ).first()
+            if already:
+                continue
+            logger.info(f"Applying migration {migration.VERSION}: {migration.DESCRIPTION}")
+            migration.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=migration.VERSION,
+                description=migration.DESCRIPTION,
+                applied_at=datetime.now(),
+            ))
+            done.append(migration.VERSION)
+    return done
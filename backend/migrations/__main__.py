@@ -0,0 +1,54 @@
+import argparse
+import logging
+import sys
+
+from database.db_test.db import engine, Base
+from database.db_test import models  # noqa: F401  (registers the tables on Base)
+
+from . import MIGRATIONS, applied_versions, upgrade
+from .check_plans import explain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schema migrations and query plan checks")
+    parser.add_argument("command", choices=["upgrade", "status", "check-plans"])
+    parser.add_argument("--skip-plan-check", action="store_true", help="upgrade without checking the hot query plans")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "upgrade":
+        Base.metadata.create_all(bind=engine)
+        applied = upgrade(engine)
+        print(f"Applied: {', '.join(applied)}" if applied else "Schema is up to date")
+        if not args.skip_plan_check:
+            report_plans()
+
+    elif args.command == "status":
+        applied = set(applied_versions(engine))
+        for migration in MIGRATIONS:
+            state = "applied" if migration.VERSION in applied else "pending"
+            print(f"{migration.VERSION}  {state:8}  {migration.DESCRIPTION}")
+
+    else:
+        report_plans()
+
+
+def report_plans():
+    """Print the hot query plans; exit 1 if any scans a hot table or misses its index."""
+    results = explain(engine)
+    for result in results:
+        print(f"[{'ok' if result.ok else 'REGRESSED'}] {result.name}")
+        for line in result.plan.splitlines():
+            print(f"    {line}")
+        for scan in result.seq_scans:
+            print(f"    ! sequential scan: {scan}")
+        for index in result.missing_indexes:
+            print(f"    ! expected index not used: {index}")
+    failed = [r.name for r in results if not r.ok]
+    if failed:
+        print(f"Plan regression on hot path: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+EXPLAIN-based regression check for the hot queries.
+
+Runs EXPLAIN for each query the API issues on a hot path and fails when the
+planner falls back to a sequential scan of `calls` or `models`, or when one
+of the indexes the query is expected to use (EXPECTED_INDEXES) is missing
+from its plan. On Postgres sequential scans are disabled for the session
+first, so small tables (where a seq scan is legitimately cheaper) still show
+whether a usable index exists.
+
+    python -m backend.migrations check-plans   # exit 1 on a regression
+
+`upgrade` runs the same check after migrating, so a deploy step running it
+fails when a hot query stops using its index.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+
+from database.db_test import models
+
+HOT_TABLES = {models.Call.__tablename__, models.Model.__tablename__}
+
+# Indexes from migration 0001; the unique ones fall back to ix_ names while the column has duplicates
+CALLS_USER_STARTED = ("ix_calls_user_id_call_started_at",)
+CALLS_CALL_ID = ("ux_calls_call_id", "ix_calls_call_id")
+MODELS_MODEL_ID = ("ux_models_model_id", "ix_models_model_id")
+MODELS_CLIENT = ("ix_models_client_name_model_id",)
+
+# Per query, the indexes its plan must use: one name out of each tuple
+EXPECTED_INDEXES: Dict[str, List[Tuple[str, ...]]] = {
+    "call_history": [CALLS_USER_STARTED],
+    "dashboard": [CALLS_USER_STARTED, MODELS_CLIENT + MODELS_MODEL_ID],
+    "call_by_call_id": [CALLS_CALL_ID],
+    "call_details": [CALLS_CALL_ID, MODELS_CLIENT + MODELS_MODEL_ID],
+    "model_by_id": [MODELS_MODEL_ID],
+    "models_by_client": [MODELS_CLIENT],
+}
+
+
+@dataclass
+class PlanResult:
+    name: str
+    plan: str
+    seq_scans: List[str]
+    missing_indexes: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.seq_scans and not self.missing_indexes
+
+
+def hot_queries():
+    now = datetime.now()
+    return {
+        "call_history": select(models.Call).where(models.Call.user_id == 1),
+        "dashboard": (
+            select(models.Call)
+            .join(models.Model, models.Model.model_id == models.Call.model_id)
+            .where(
+                models.Call.user_id == 1,
+                models.Call.call_started_at >= now - timedelta(days=7),
+                models.Call.call_started_at <= now,
+                models.Model.client_name == "SBI",
+            )
+        ),
+        "call_by_call_id": select(models.Call).where(models.Call.call_id == "call-0"),
+        "call_details": (
+            select(models.Call)
+            .join(models.Model, models.Model.model_id == models.Call.model_id)
+            .where(
+                models.Call.user_id == 1,
+                models.Call.call_id == "call-0",
+                models.Model.client_name == "SBI",
+            )
+        ),
+        "model_by_id": select(models.Model).where(models.Model.model_id == "model-0"),
+        "models_by_client": select(models.Model).where(models.Model.client_name == "SBI"),
+    }
+
+
+def _seq_scans(dialect: str, plan_lines: List[str]) -> List[str]:
+    found = []
+    for line in plan_lines:
+        if dialect == "postgresql":
+            match = re.search(r"Seq Scan on (\w+)", line)
+        else:
+            # SQLite: "SCAN calls" is a full scan, "SEARCH calls USING INDEX ..." is not
+            match = re.search(r"\bSCAN (?:TABLE )?(\w+)", line)
+        if match and match.group(1) in HOT_TABLES:
+            found.append(line.strip())
+    return found
+
+
+def _missing_indexes(name: str, plan: str) -> List[str]:
+    return [
+        " or ".join(choices)
+        for choices in EXPECTED_INDEXES.get(name, [])
+        if not any(re.search(rf"\b{re.escape(index)}\b", plan) for index in choices)
+    ]
+
+
+def explain(engine: Engine) -> List[PlanResult]:
+    results = []
+    with engine.connect() as conn:
+        dialect = conn.dialect.name
+        if dialect == "postgresql":
+            conn.execute(text("SET enable_seqscan = off"))
+        prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+        for name, stmt in hot_queries().items():
+            compiled = stmt.compile(dialect=conn.dialect)
+            params = (
+                tuple(compiled.params[key] for key in compiled.positiontup)
+                if compiled.positional else compiled.params
+            )
+            rows = conn.exec_driver_sql(prefix + str(compiled), params).fetchall()
+            # SQLite rows are (id, parent, notused, detail); Postgres rows are single text lines
+            lines = [str(row[-1]) for row in rows]
+            plan = "\n".join(lines)
+            results.append(PlanResult(name, plan, _seq_scans(dialect, lines), _missing_indexes(name, plan)))
+        conn.rollback()
+    return results
+
@@ -0,0 +1,48 @@
+"""Indexes for the hot query paths (history, dashboard, transcript/details, model joins)."""
+import logging
+
+from sqlalchemy import Index, func, select
+from sqlalchemy.engine import Connection
+
+from database.db_test import models
+
+logger = logging.getLogger("migrations")
+
+VERSION = "0001"
+DESCRIPTION = "Composite and unique indexes for calls and models hot paths"
+
+Call = models.Call.__table__
+Model = models.Model.__table__
+
+# Call history / dashboards: WHERE user_id = ? AND call_started_at BETWEEN ? AND ?
+calls_user_started = Index("ix_calls_user_id_call_started_at", Call.c.user_id, Call.c.call_started_at)
+# Join calls -> models
+calls_model_id = Index("ix_calls_model_id", Call.c.model_id)
+# get_models and the client filter of the dashboard/details join, covering the join key
+models_client_model = Index("ix_models_client_name_model_id", Model.c.client_name, Model.c.model_id)
+
+# Transcript, stream, details and dispatch lookups are by these keys and expect one row
+UNIQUE_INDEXES = [
+    ("ux_calls_call_id", Call, Call.c.call_id),
+    ("ux_models_model_id", Model, Model.c.model_id),
+]
+
+
+def _has_duplicates(conn: Connection, column) -> bool:
+    duplicate = conn.execute(
+        select(column).group_by(column).having(func.count() > 1).limit(1)
+    ).first()
+    return duplicate is not None
+
+
+def upgrade(conn: Connection):
+    for index in (calls_user_started, calls_model_id, models_client_model):
+        index.create(bind=conn, checkfirst=True)
+
+    for name, table, column in UNIQUE_INDEXES:
+        if _has_duplicates(conn, column):
+            # Still index the lookup; the duplicates need cleaning up before it can be unique
+            logger.warning(f"{table.name}.{column.name} has duplicate values, creating a non-unique index")
+            Index(f"ix_{name[3:]}", column).create(bind=conn, checkfirst=True)
+        else:
+            Index(name, column, unique=True).create(bind=conn, checkfirst=True)
@@ -0,0 +1,44 @@
+"""Full-text index over finalized call transcripts (FTS5 on SQLite, tsvector + GIN on Postgres)."""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+VERSION = "0002"
+DESCRIPTION = "Transcript full-text search index"
+
+SQLITE_DDL = [
+    # rowid is calls.id, so an entry is replaced by key. Metadata columns are
+    # UNINDEXED: stored for filtering and display, not tokenized
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS call_transcripts_fts USING fts5(
+        call_id UNINDEXED,
+        user_id UNINDEXED,
+        client UNINDEXED,
+        name UNINDEXED,
+        call_started_at UNINDEXED,
+        transcript,
+        tokenize = 'porter unicode61'
+    )
+    """,
+]
+
+POSTGRES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS call_transcript_search (
+        call_id VARCHAR PRIMARY KEY,
+        user_id INTEGER,
+        client VARCHAR,
+        name VARCHAR,
+        call_started_at TIMESTAMP,
+        transcript TEXT NOT NULL,
+        document TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', transcript)) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_call_transcript_search_document ON call_transcript_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS ix_call_transcript_search_user_client ON call_transcript_search (user_id, client)",
+]
+
+
+def upgrade(conn: Connection):
+    statements = POSTGRES_DDL if conn.dialect.name == "postgresql" else SQLITE_DDL
+    for statement in statements:
+        conn.execute(text(statement))
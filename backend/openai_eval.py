@@ -1,8 +1,13 @@
 import os
-from openai import OpenAI
+import asyncio
+from openai import OpenAI, RateLimitError
 from dotenv import load_dotenv
 import json
 from datetime import datetime
+from .local_extraction import extract_local_entities
+from .extractor_registry import get_compiled_extractor
+from .eval_metrics import track_eval, note_resend
+from .llm_admission import llm_limiter, estimate_tokens
 # from prompt_for_eval.azent import get_lead_classification_prompt
 
 
@@ -25,6 +30,11 @@ if not api_key:
 # Instantiate the client
 client = OpenAI(api_key=api_key)
 
+# Structured outputs (json_schema response_format) need gpt-4o-mini or newer
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", "gpt-4o-mini")
+# Times a completion is re-queued after OpenAI answers 429
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+
 
 async def has_user_speech(transcript: str) -> bool:
     for line in transcript.split("\n"):
@@ -33,6 +43,89 @@ async def has_user_speech(transcript: str) -> bool:
     return False
 
 
+def _retry_after(error: RateLimitError, attempt: int) -> float:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return float(2 ** attempt)
+
+
+async def admitted_completion(client, **kwargs):
+    """
+    client.chat.completions.create, once admitted by the shared LLM limiter.
+
+    The request waits in the limiter's queue at the priority of the calling
+    context (see llm_admission), then runs in a worker thread so the event loop
+    is not blocked. A 429 pauses the limiter for Retry-After and re-queues the
+    request, up to LLM_RATE_LIMIT_RETRIES times; the SDK's own retries are
+    turned off so every attempt goes through the limiter.
+    """
+    client = client.with_options(max_retries=0)
+    estimated = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens"))
+    for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+        await llm_limiter.acquire(estimated)
+        try:
+            response = await asyncio.to_thread(client.chat.completions.create, **kwargs)
+        except RateLimitError as e:
+            if attempt == LLM_RATE_LIMIT_RETRIES:
+                raise
+            llm_limiter.backoff(_retry_after(e, attempt))
+            note_resend()
+            continue
+        usage = getattr(response, "usage", None)
+        llm_limiter.record_usage(estimated, getattr(usage, "total_tokens", None))
+        return response
+
+
+async def complete_structured(client, model: str, messages: list, response_format: dict, validate, temperature: float, tracker=None) -> dict:
+    """
+    Runs a structured-output completion and validates the reply once.
+
+    If the reply does not parse or fails `validate`, the model gets a single
+    repair attempt with the problems listed; a second failure raises ValueError.
+    Both completions are reported to `tracker` when one is given.
+    """
+    response = await admitted_completion(
+        client,
+        model=model,
+        messages=messages,
+        response_format=response_format,
+        temperature=temperature
+    )
+    if tracker is not None:
+        tracker.add_response(response)
+    content = response.choices[0].message.content
+    data, errors = _parse_and_validate(content, validate)
+    if not errors:
+        return data
+
+    repair_messages = messages + [
+        {"role": "assistant", "content": content or ""},
+        {"role": "user", "content": f"That reply was invalid: {'; '.join(errors)}. Return only the corrected JSON object."}
+    ]
+    response = await admitted_completion(
+        client,
+        model=model,
+        messages=repair_messages,
+        response_format=response_format,
+        temperature=temperature
+    )
+    if tracker is not None:
+        tracker.add_response(response)
+    data, errors = _parse_and_validate(response.choices[0].message.content, validate)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return data
+
+
+def _parse_and_validate(content: str, validate):
+    try:
+        data = json.loads(content or "")
+    except json.JSONDecodeError as e:
+        return None, [f"reply is not valid JSON ({e})"]
+    return data, validate(data)
+
+
 NO_USER_EVAL = "{\n\"clarity\": { \"score\": 0, \"feedback\": \"There is no user speech in the provided transcript.\" },\n\"fluency\": { \"score\": 0, \"feedback\": \"There is no user speech in the provided transcript.\" },\n\"coherence\": { \"score\": 0, \"feedback\": \"There is no user speech in the provided transcript.\" },\n\"engagement\": { \"score\": 0, \"feedback\": \"There is no user speech in the provided transcript.\" },\n\"vocabulary\": { \"score\": 0, \"feedback\": \"There is no user speech in the provided transcript.\" },\n\"listening\": { \"score\": 0, \"feedback\": \"There is no user speech in the provided transcript.\" },\n\"summary\": \"No user speech was present in the conversation for evaluation.\",\n\"tip\": \"Ensure to provide user speech in the transcript for a comprehensive evaluation of communication skills.\"\n}"
 
 async def call_summary(transcript: str) -> str:
@@ -57,20 +150,23 @@ Transcript:
 {transcript}
     """
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a professional conversation summarizer for a flight booking service. Your task is to analyse the conversation transcript and pick out the key points discussed between the user and the agent. Summary should be crisp, concise and clear."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.2
-        )
+        with track_eval("call_summary") as tracker:
+            response = await admitted_completion(
+                client,
+                model="gpt-3.5-turbo-0125",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a professional conversation summarizer for a flight booking service. Your task is to analyse the conversation transcript and pick out the key points discussed between the user and the agent. Summary should be crisp, concise and clear."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.2
+            )
+            tracker.add_response(response)
 
         content = response.choices[0].message.content.strip()
         result = {
@@ -108,65 +204,39 @@ async def extract_entities_from_transcript(transcript: str, fields: list[tuple[s
 
     client = OpenAI(api_key=api_key)
 
-    # Prepare dynamic prompt
-    field_instructions = "\n".join(
-        [f"{i+1}. {field}: {desc}" for i, (field, desc) in enumerate(fields)]
-    )
-
-    # JSON template
-    json_template = ",\n".join(
-        [f'"{field}": {{"text": "...", "value": "...", "confidence": "..."}}' for field, _ in fields]
-    )
-
-    prompt = f"""
-You are an intelligent entity extraction system. Given a conversation transcript, extract the following fields ONLY based on what the USER says.
-
-Ignore the interviewer, assistant, or system. Focus only on USER responses.
-
-Here are the fields to extract:
-{field_instructions}
-
-Return a JSON object in the following format:
-{{
-{json_template}
-}}
-
-Rules:
-- "text": the actual user quote where the information is mentioned
-- "value": cleaned, structured value
-- "confidence": "high", "medium", "low" depending on clarity of user speech
-- If the user does not mention something, return:
-  {{ "text": "NA", "value": "Not Mentioned", "confidence": "NA" }}
-- Do NOT include commentary. Only return valid JSON.
-Transcript:
-{transcript}
-"""
+    # Resolve pattern-friendly fields locally, only the rest goes to the LLM
+    local_entities, pending_fields = extract_local_entities(transcript, fields)
+    if fields and not pending_fields:
+        with track_eval("extraction", model="local"):
+            return local_entities
+
+    # Prompt and JSON schema are compiled once per field set, see extractor_registry
+    extractor = get_compiled_extractor(pending_fields)
+    messages = [
+        {
+            "role": "system",
+            "content": "You are a specialized entity extraction system that focuses on job-related lifestyle and earnings information from user responses in conversations. Extract only what the user explicitly states."
+        },
+        {
+            "role": "user",
+            "content": extractor.render_prompt(transcript)
+        }
+    ]
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a specialized entity extraction system that focuses on job-related lifestyle and earnings information from user responses in conversations. Extract only what the user explicitly states."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.2
-        )
-
-        content = response.choices[0].message.content
-        # Remove markdown ```json ... ``` wrapping if present
-        if content.startswith("```json"):
-            content = content[7:]  # Remove ```json\n
-        if content.endswith("```"):
-            content = content[:-3]  # Remove trailing ```
-
-        content = content.strip()
-        return json.loads(content)
+        with track_eval("extraction", model=EXTRACTION_MODEL) as tracker:
+            entities = await complete_structured(
+                client,
+                model=EXTRACTION_MODEL,
+                messages=messages,
+                response_format=extractor.response_format,
+                validate=extractor.validate,
+                temperature=0.2,
+                tracker=tracker
+            )
+        entities.update(local_entities)
+        # Keep the configured field order regardless of which stage resolved a field
+        return {field: entities[field] for field, _ in fields or [] if field in entities} | entities
 
     except Exception as e:
         # Return default structure with "Not Mentioned"
@@ -229,28 +299,31 @@ Transcript:
 """
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a professional communication coach and evaluator. Evaluate user conversations with structured metrics."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.3
-        )
-        content = response.choices[0].message.content
-        if content.startswith("```json"):
-            content = content[7:]  # Remove ```json\n
-        if content.endswith("```"):
-            content = content[:-3]  # Remove trailing ```
-
-        content = content.strip()
-        return json.loads(content)
+        with track_eval("conversation_eval") as tracker:
+            response = await admitted_completion(
+                client,
+                model="gpt-3.5-turbo-0125",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a professional communication coach and evaluator. Evaluate user conversations with structured metrics."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.3
+            )
+            tracker.add_response(response)
+            content = response.choices[0].message.content
+            if content.startswith("```json"):
+                content = content[7:]  # Remove ```json\n
+            if content.endswith("```"):
+                content = content[:-3]  # Remove trailing ```
+
+            content = content.strip()
+            return json.loads(content)
         # result = json.loads(llm_output)
         # return result
     
@@ -275,7 +348,8 @@ async def extract_job_entities_mysyara(transcript: str, fields: list[tuple[str,
         raise ValueError("OPENAI_API_KEY not found in environment variables")
 
     try:
-        response = client.chat.completions.create(
+        response = await admitted_completion(
+            client,
             model="gpt-4o",
             messages=[
                 {
@@ -399,7 +473,8 @@ Transcript:
 """
 
     try:
-        response = client.chat.completions.create(
+        response = await admitted_completion(
+            client,
             model="gpt-3.5-turbo-0125",
             messages=[
                 {
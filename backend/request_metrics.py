@@ -0,0 +1,337 @@
+"""
+Per-route latency histograms and per-request span timing.
+
+RequestMetricsMiddleware times every HTTP request and, through a contextvar,
+collects how much of it was spent in the database, S3 and LLM calls. Code
+doing such work wraps it in `span("s3")` etc.; database time is recorded by
+SQLAlchemy cursor events once `instrument_engine` is attached. Contextvars
+are copied into threadpool calls, so sync routes and `asyncio.to_thread`
+work is attributed to the request that started it.
+
+A single request can be profiled by sending `X-Profile: <PROFILE_TOKEN>` (or
+`?profile=<PROFILE_TOKEN>`) when PROFILING_ENABLED is true. pyinstrument is
+used when installed (it follows the request across awaits), cProfile
+otherwise. Both sample the event loop thread only, not threadpool work. The profile is kept in memory and its id returned in the
+`X-Profile-Id` response header.
+"""
+import bisect
+import contextvars
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger("request-metrics")
+
+# Upper bounds in seconds, the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SPAN_CATEGORIES = ("db", "s3", "llm")
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "20"))
+
+
+class RequestSpans:
+    """Seconds spent per category during one request; shared with worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, category: str, seconds: float):
+        with self.lock:
+            self.seconds[category] = self.seconds.get(category, 0.0) + seconds
+            self.counts[category] = self.counts.get(category, 0) + 1
+
+
+_request_spans: contextvars.ContextVar[Optional[RequestSpans]] = contextvars.ContextVar("request_spans", default=None)
+
+
+def record_span(category: str, seconds: float):
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.add(category, seconds)
+
+
+@contextmanager
+def span(category: str):
+    """Attribute the time spent in this block to `category` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(category, time.perf_counter() - start)
+
+
+def instrument_engine(engine):
+    """Record statement execution time of a (sync) engine as "db" spans."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("request_metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("request_metrics_start")
+        if starts:
+            record_span("db", time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("request_metrics_start") if context.connection is not None else None
+        if starts:
+            record_span("db", time.perf_counter() - starts.pop())
+
+    return engine
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        rank, seen = p / 100 * self.count, 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else round(self.max, 3)
+        return round(self.max, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": round(self.max, 4),
+            "buckets": {
+                **{str(le): count for le, count in zip(self.buckets, self.counts)},
+                "+Inf": self.counts[-1],
+            },
+        }
+
+
+class RouteStats:
+    def __init__(self):
+        self.total = LatencyHistogram()
+        self.spans = {category: LatencyHistogram() for category in SPAN_CATEGORIES}
+        self.statuses: Dict[str, int] = {}
+
+    def observe(self, seconds: float, status: int, spans: RequestSpans):
+        self.total.observe(seconds)
+        for category, histogram in self.spans.items():
+            histogram.observe(spans.seconds.get(category, 0.0))
+        status_class = f"{status // 100}xx"
+        self.statuses[status_class] = self.statuses.get(status_class, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.total.to_dict(),
+            **{f"{category}_time": histogram.to_dict() for category, histogram in self.spans.items()},
+            "status": self.statuses,
+        }
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.routes: Dict[str, RouteStats] = {}
+        self.profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def observe(self, route: str, seconds: float, status: int, spans: RequestSpans):
+        self.routes.setdefault(route, RouteStats()).observe(seconds, status, spans)
+
+    def summary(self) -> Dict[str, Any]:
+        return {route: stats.to_dict() for route, stats in sorted(self.routes.items())}
+
+    def prometheus(self) -> str:
+        """Histograms in the Prometheus text exposition format."""
+        lines = []
+        metrics = [("http_request_duration_seconds", lambda stats: stats.total)]
+        metrics += [(f"http_request_{c}_seconds", lambda stats, c=c: stats.spans[c]) for c in SPAN_CATEGORIES]
+        for name, pick in metrics:
+            lines.append(f"# TYPE {name} histogram")
+            for route, stats in sorted(self.routes.items()):
+                method, path = route.split(" ", 1)
+                labels = f'method="{method}",route="{path}"'
+                histogram, cumulative = pick(stats), 0
+                for le, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def store_profile(self, profile_id: str, route: str, seconds: float, output: str, profiler: str):
+        self.profiles[profile_id] = {
+            "id": profile_id,
+            "route": route,
+            "duration": round(seconds, 4),
+            "profiler": profiler,
+            "timestamp": time.time(),
+            "output": output,
+        }
+        while len(self.profiles) > PROFILE_MAX_STORED:
+            self.profiles.popitem(last=False)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in profile.items() if k != "output"} for profile in reversed(self.profiles.values())]
+
+
+request_metrics = RequestMetrics()
+
+
+# Set while a request is being profiled; one profile at a time per process
+_profiling = False
+
+
+def _stop_profiling():
+    global _profiling
+    _profiling = False
+
+
+class _RequestProfiler:
+    """pyinstrument when available (async aware), cProfile otherwise."""
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+            self.name = "pyinstrument"
+            self.profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        except ImportError:
+            import cProfile
+            self.name = "cProfile"
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.name == "pyinstrument":
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self) -> str:
+        if self.name == "pyinstrument":
+            self.profiler.stop()
+            return self.profiler.output_text(unicode=False, color=False)
+        import pstats
+        self.profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(60)
+        return out.getvalue()
+
+
+def _start_profiler() -> Optional[_RequestProfiler]:
+    """
+    A started profiler, or None when one is already running: profilers hook
+    the whole thread, so a second one would fail or mix in the other request.
+    """
+    global _profiling
+    if _profiling:
+        logger.warning("Profile requested while another request is being profiled; serving it unprofiled")
+        return None
+    profiler = _RequestProfiler()
+    try:
+        profiler.start()
+    except Exception as e:
+        # e.g. a debugger or APM agent already holds the profiling hook
+        logger.warning(f"Could not start {profiler.name} profiler: {e}")
+        return None
+    _profiling = True
+    return profiler
+
+
+def _profile_requested(scope) -> bool:
+    if not PROFILING_ENABLED or not PROFILE_TOKEN:
+        return False
+    for key, value in scope.get("headers") or []:
+        if key == b"x-profile" and value.decode("latin-1") == PROFILE_TOKEN:
+            return True
+    query = scope.get("query_string", b"").decode("latin-1")
+    return f"profile={PROFILE_TOKEN}" in query.split("&")
+
+
+def _route_name(app, scope) -> str:
+    """Route template (e.g. /api/transcript/{call_id}) so histograms do not grow per id."""
+    from starlette.routing import Match
+
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+    return f"{scope['method']} unmatched"
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and db/s3/llm span time per route.
+
+    Latency runs until the last body chunk is sent, so streamed responses are
+    measured in full.
+    """
+
+    def __init__(self, app, router_app=None):
+        self.app = app
+        self.router_app = router_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans = RequestSpans()
+        token = _request_spans.set(spans)
+        status = 500
+        profiler = _start_profiler() if _profile_requested(scope) else None
+        profile_id = uuid.uuid4().hex[:12] if profiler is not None else None
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                if profiler is not None:
+                    headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_spans.reset(token)
+            route = _route_name(self.router_app, scope)
+            request_metrics.observe(route, elapsed, status, spans)
+            if profiler is not None:
+                try:
+                    output = profiler.stop()
+                    request_metrics.store_profile(profile_id, route, elapsed, output, profiler.name)
+                    logger.info(f"Profiled {route} in {elapsed:.3f}s as {profile_id}")
+                except Exception as e:
+                    logger.error(f"Failed to capture profile for {route}: {e}")
+                finally:
+                    _stop_profiling()
@@ -0,0 +1,63 @@
+"""
+orjson-backed JSON responses.
+
+Datetimes are written the way `datetime.isoformat()` writes them (naive
+values without an offset, microseconds only when non-zero), which is what
+the stdlib encoder path produced for call history, so clients see the same
+timestamps. Routes that build large payloads can return `FastJSONResponse`
+directly to also skip FastAPI's jsonable_encoder pass.
+"""
+import dataclasses
+import logging
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger("responses")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.error("orjson is not installed, falling back to the stdlib JSON encoder")
+
+
+def _default(value: Any) -> Any:
+    """Types orjson does not serialize natively, rendered like jsonable_encoder does."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if hasattr(value, "_mapping"):  # SQLAlchemy Row
+        return dict(value._mapping)
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_default(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return _default(value)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is None:
+        import json
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_stdlib_default).encode("utf-8")
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("singleflight")
+
+# Deletes the lock only if we still own it, so a slow leader never frees a lock
+# that already expired and was taken over by another worker.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight execution.
+
+    Callers in the same process await a shared task. When a Redis URL is given,
+    a Redis lock extends this across uvicorn workers: the lock holder runs the
+    work and publishes the JSON result for a short time, the others wait for it.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        redis_url: Optional[str] = None,
+        lock_ttl: float = 120.0,
+        result_ttl: float = 30.0,
+        poll_interval: float = 0.25,
+    ):
+        self.namespace = namespace
+        self.redis_url = redis_url
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._redis = None
+
+    async def _get_redis(self):
+        if not self.redis_url:
+            return None
+        if self._redis is None:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(self.redis_url)
+            except ImportError:
+                logger.error("Redis not available. Install redis with: pip install redis")
+                self.redis_url = None
+                return None
+        return self._redis
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn` for `key`, or await the execution already in flight for it."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        # Shield so that one caller going away does not cancel the shared work
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every waiter went away
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        redis = await self._get_redis()
+        if redis is None:
+            return await fn()
+
+        lock_key = f"singleflight:{self.namespace}:lock:{key}"
+        result_key = f"singleflight:{self.namespace}:result:{key}"
+        token = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+
+        # Only the Redis calls are guarded: an error raised by fn() must reach the
+        # caller as is, not be mistaken for Redis being down and run fn() again
+        while True:
+            try:
+                cached = await redis.get(result_key)
+                acquired = cached is None and await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+            except Exception as e:
+                logger.warning(f"Redis single-flight unavailable for {key}: {e}")
+                return await fn()
+            if cached is not None:
+                return json.loads(cached)
+            if acquired:
+                break
+            if loop.time() >= deadline:
+                logger.warning(f"Timed out waiting for {lock_key}, running locally")
+                return await fn()
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            result = await fn()
+            try:
+                await redis.set(result_key, json.dumps(result, default=str), px=int(self.result_ttl * 1000))
+            except Exception as e:
+                logger.warning(f"Failed to publish single-flight result for {key}: {e}")
+            return result
+        finally:
+            try:
+                await redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                logger.warning(f"Failed to release single-flight lock {lock_key}: {e}")
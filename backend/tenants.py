@@ -0,0 +1,234 @@
+"""
+Per-client (tenant) resources for serving every client from one deployment.
+
+A request's tenant comes from the client in its URL, or from the model of
+the call it touches. Each tenant gets its S3 bucket and prefixes, a rate
+limit and its own cache partition; S3 connectors are shared per bucket.
+
+Defaults apply to every client; TENANTS_CONFIG (JSON keyed by client name)
+overrides them per client, e.g.
+
+    {"sbi": {"transcripts_prefix": "transcripts/sbi", "rate_limit_per_minute": 300},
+     "shunya": {"bucket": "shunya-calls", "cache_size": 64}}
+
+The client in CLIENT_NAME keeps its transcript prefix spelled exactly as
+configured, which is where single-client deployments wrote transcripts.
+
+Only known clients get a tenant: CLIENT_NAME, TENANTS_CONFIG keys, clients
+passed in `known_clients` (extractor config) and clients registered from
+models.Model, so arbitrary URL segments cannot grow the per-tenant maps.
+A client added on another worker is found by looking it up in models.Model
+(see discover_client); misses are remembered for UNKNOWN_CLIENT_TTL_SECONDS.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from sqlalchemy import select
+
+from database.connectors.s3 import S3Connector
+from database.db_test import models
+
+logger = logging.getLogger("tenants")
+
+DEFAULT_CLIENT = os.getenv("CLIENT_NAME")
+TENANT_RATE_LIMIT_PER_MINUTE = float(os.getenv("TENANT_RATE_LIMIT_PER_MINUTE", "600"))
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "256"))
+# How long a client found to have no model is not looked up again
+UNKNOWN_CLIENT_TTL_SECONDS = float(os.getenv("UNKNOWN_CLIENT_TTL_SECONDS", "60"))
+UNKNOWN_CLIENT_MEMORY_SIZE = 10000
+
+
+class UnknownTenant(KeyError):
+    """The client is not configured and has no models."""
+
+
+@dataclass
+class Tenant:
+    name: str
+    bucket: Optional[str]
+    transcripts_prefix: str
+    recordings_prefix: str
+    rate_limit_per_minute: float
+    cache_size: int
+
+    def transcript_path(self, year, month, call_id: str) -> str:
+        return f"{self.transcripts_prefix}/{year}/{month}/{call_id}.txt"
+
+    def recording_path(self, call_id: str) -> str:
+        return f"{self.recordings_prefix}/{call_id}.mp3"
+
+
+class TenantCache:
+    """LRU cache with one bounded partition per tenant, so a busy client cannot evict the others."""
+
+    def __init__(self):
+        self.partitions: Dict[str, "OrderedDict[str, Any]"] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tenant: Tenant, key: str) -> Any:
+        partition = self.partitions.get(tenant.name)
+        if partition is None or key not in partition:
+            self.misses += 1
+            return None
+        partition.move_to_end(key)
+        self.hits += 1
+        return partition[key]
+
+    def set(self, tenant: Tenant, key: str, value: Any):
+        if tenant.cache_size <= 0:
+            return
+        partition = self.partitions.setdefault(tenant.name, OrderedDict())
+        partition[key] = value
+        partition.move_to_end(key)
+        while len(partition) > tenant.cache_size:
+            partition.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": {name: len(partition) for name, partition in self.partitions.items()},
+        }
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated: float = field(default_factory=time.monotonic)
+
+
+class TenantRateLimiter:
+    """Token bucket per tenant, refilled at rate_limit_per_minute (per process)."""
+
+    def __init__(self):
+        self.buckets: Dict[str, _Bucket] = {}
+        self.rejected: Dict[str, int] = {}
+
+    def try_acquire(self, tenant: Tenant) -> float:
+        """0 if the request may proceed, else seconds until a token is available."""
+        rate = tenant.rate_limit_per_minute / 60
+        if rate <= 0:
+            return 0.0
+        capacity = max(1.0, rate * 60)
+        bucket = self.buckets.setdefault(tenant.name, _Bucket(tokens=capacity))
+        now = time.monotonic()
+        bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        self.rejected[tenant.name] = self.rejected.get(tenant.name, 0) + 1
+        return (1 - bucket.tokens) / rate
+
+
+class TenantRegistry:
+    def __init__(self, overrides: Optional[Dict[str, Dict[str, Any]]] = None, default_client: Optional[str] = DEFAULT_CLIENT,
+                 known_clients: Iterable[str] = ()):
+        self.overrides = {name.lower(): values for name, values in (overrides or {}).items()}
+        self.default_client = default_client
+        self.known_clients = set(self.overrides) | {(default_client or "default").lower()}
+        self.register_clients(known_clients)
+        self.tenants: Dict[str, Tenant] = {}
+        self.model_clients: Dict[str, str] = {}
+        self.unknown_clients: Dict[str, float] = {}  # client -> monotonic time its miss expires
+        self.s3_connectors: Dict[Optional[str], S3Connector] = {}
+        self.cache = TenantCache()
+        self.rate_limiter = TenantRateLimiter()
+
+    @classmethod
+    def from_env(cls, known_clients: Iterable[str] = ()) -> "TenantRegistry":
+        try:
+            overrides = json.loads(os.getenv("TENANTS_CONFIG", "{}"))
+        except ValueError as e:
+            logger.error(f"Invalid TENANTS_CONFIG, using defaults for every client: {e}")
+            overrides = {}
+        return cls(overrides, known_clients=known_clients)
+
+    def register_clients(self, clients: Iterable[Optional[str]]):
+        self.known_clients.update(client.lower() for client in clients if client)
+
+    def client_query(self, client: str):
+        """A model of `client`, if it has any (models.Model stores client names upper-case)."""
+        return select(models.Model.client_name).where(models.Model.client_name == client.upper()).limit(1)
+
+    def discover_client(self, client: str, has_model: Callable[[str], bool]) -> bool:
+        """
+        Register an unknown client if `has_model(client)` finds a model for it,
+        e.g. one created through another worker. Misses are not retried for
+        UNKNOWN_CLIENT_TTL_SECONDS.
+        """
+        key = client.lower()
+        now = time.monotonic()
+        if self.unknown_clients.get(key, 0.0) > now:
+            return False
+        if not has_model(client):
+            if len(self.unknown_clients) >= UNKNOWN_CLIENT_MEMORY_SIZE:
+                self.unknown_clients.clear()
+            self.unknown_clients[key] = now + UNKNOWN_CLIENT_TTL_SECONDS
+            return False
+        self.unknown_clients.pop(key, None)
+        self.register_clients([client])
+        return True
+
+    def get(self, client: Optional[str]) -> Tenant:
+        """
+        Tenant for a client name in any case (URLs use lower, models.Model upper).
+        Raises UnknownTenant for a client that is not known.
+        """
+        client = client or self.default_client or "default"
+        key = client.lower()
+        tenant = self.tenants.get(key)
+        if tenant is None:
+            if key not in self.known_clients:
+                raise UnknownTenant(client)
+            values = self.overrides.get(key, {})
+            # Single-client deployments wrote transcripts under CLIENT_NAME as spelled
+            prefix_name = self.default_client if self.default_client and self.default_client.lower() == key else key
+            tenant = Tenant(
+                name=key,
+                bucket=values.get("bucket", os.getenv("AWS_BUCKET")),
+                transcripts_prefix=values.get("transcripts_prefix", f"transcripts/{prefix_name}"),
+                recordings_prefix=values.get("recordings_prefix", "mp3"),
+                rate_limit_per_minute=float(values.get("rate_limit_per_minute", TENANT_RATE_LIMIT_PER_MINUTE)),
+                cache_size=int(values.get("cache_size", TENANT_CACHE_SIZE)),
+            )
+            self.tenants[key] = tenant
+        return tenant
+
+    def model_client_query(self, model_id: Optional[str]):
+        return select(models.Model.client_name).where(models.Model.model_id == model_id)
+
+    def cached_model_client(self, model_id: Optional[str]) -> Optional[str]:
+        return self.model_clients.get(model_id)
+
+    def remember_model_client(self, model_id: Optional[str], client: Optional[str]) -> Tenant:
+        """Record which client a model belongs to and return its tenant."""
+        if model_id is not None and client:
+            self.model_clients[model_id] = client
+            self.register_clients([client])
+        return self.get(client)
+
+    def forget_model_client(self, model_id: Optional[str]):
+        """Drop the cached client of a model whose client may have changed."""
+        self.model_clients.pop(model_id, None)
+
+    def s3(self, tenant: Tenant) -> S3Connector:
+        """One connector per bucket, shared by every tenant and request using it."""
+        connector = self.s3_connectors.get(tenant.bucket)
+        if connector is None:
+            connector = self.s3_connectors[tenant.bucket] = S3Connector(tenant.bucket)
+        return connector
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "tenants": sorted(self.tenants),
+            "s3_connectors": len(self.s3_connectors),
+            "cache": self.cache.metrics(),
+            "rate_limited": dict(self.rate_limiter.rejected),
+        }
@@ -0,0 +1,186 @@
+"""
+Full-text search over finalized call transcripts.
+
+Transcripts are indexed when they are ingested (get_transcript, once the call
+has ended) into the table created by migration 0002: an FTS5 virtual table on
+SQLite, a generated tsvector column with a GIN index on Postgres. Each entry
+carries the call's user, client, name and start time, so results need no
+join and archived calls stay searchable. FTS5 entries are keyed by
+rowid = calls.id, so re-indexing a call replaces its entry by key.
+
+Snippets are HTML: the transcript text is escaped and only the matched terms
+are wrapped in <mark>.
+
+    python -m backend.transcript_search backfill   # index calls ended before this existed
+"""
+import argparse
+import html
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from database.db_test import models
+
+logger = logging.getLogger("transcript-search")
+
+HIGHLIGHT_START, HIGHLIGHT_END = "<mark>", "</mark>"
+# Private-use characters the database puts around matches, swapped for the tags once the snippet is escaped
+MATCH_START, MATCH_END = "\ue000", "\ue001"
+
+SQLITE_DELETE = text("DELETE FROM call_transcripts_fts WHERE rowid = :id")
+SQLITE_INSERT = text(
+    "INSERT INTO call_transcripts_fts (rowid, call_id, user_id, client, name, call_started_at, transcript) "
+    "VALUES (:id, :call_id, :user_id, :client, :name, :call_started_at, :transcript)"
+)
+SQLITE_SEARCH = text(f"""
+    SELECT call_id, name, call_started_at,
+           -bm25(call_transcripts_fts) AS score,
+           snippet(call_transcripts_fts, 5, '{MATCH_START}', '{MATCH_END}', '…', 16) AS snippet
+    FROM call_transcripts_fts
+    WHERE call_transcripts_fts MATCH :query AND user_id = :user_id AND client = :client
+    ORDER BY bm25(call_transcripts_fts)
+    LIMIT :limit OFFSET :offset
+""")
+
+POSTGRES_UPSERT = text("""
+    INSERT INTO call_transcript_search (call_id, user_id, client, name, call_started_at, transcript)
+    VALUES (:call_id, :user_id, :client, :name, :call_started_at, :transcript)
+    ON CONFLICT (call_id) DO UPDATE SET
+        user_id = EXCLUDED.user_id, client = EXCLUDED.client, name = EXCLUDED.name,
+        call_started_at = EXCLUDED.call_started_at, transcript = EXCLUDED.transcript
+""")
+POSTGRES_SEARCH = text(f"""
+    SELECT call_id, name, call_started_at,
+           ts_rank_cd(document, query) AS score,
+           ts_headline('english', transcript, query,
+                       'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxFragments=2, MaxWords=20, MinWords=8') AS snippet
+    FROM call_transcript_search, websearch_to_tsquery('english', :query) AS query
+    WHERE document @@ query AND user_id = :user_id AND client = :client
+    ORDER BY score DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def fts5_query(query: str) -> str:
+    """User input as FTS5 syntax: every term quoted (no operators), all terms required."""
+    terms = re.findall(r"[^\s\"]+", query)
+    return " ".join('"' + term + '"' for term in terms)
+
+
+def highlight(snippet: str) -> str:
+    """Escape a snippet for HTML, then mark the matched terms."""
+    escaped = html.escape(snippet or "")
+    return escaped.replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_END, HIGHLIGHT_END)
+
+
+def _dialect(db) -> str:
+    bind = db.get_bind() if hasattr(db, "get_bind") else db
+    return bind.dialect.name
+
+
+def _entry(call, client: str, transcript: str) -> Dict[str, Any]:
+    return {
+        "id": call.id,
+        "call_id": call.call_id,
+        "user_id": call.user_id,
+        "client": client.lower(),
+        "name": call.name,
+        "call_started_at": call.call_started_at,
+        "transcript": transcript,
+    }
+
+
+def _index_statements(dialect: str, entry: Dict[str, Any]) -> List[Tuple[Any, Dict[str, Any]]]:
+    if dialect == "postgresql":
+        entry = {key: value for key, value in entry.items() if key != "id"}
+        return [(POSTGRES_UPSERT, entry)]
+    # FTS5 has no unique constraint to upsert on, and stores the start time as text
+    started_at = entry["call_started_at"]
+    entry = {**entry, "call_started_at": started_at.isoformat() if started_at else None}
+    return [(SQLITE_DELETE, {"id": entry["id"]}), (SQLITE_INSERT, entry)]
+
+
+async def index_transcript(db, call, client: str, transcript: str):
+    """Add or replace the index entry of a finalized transcript (caller commits)."""
+    for statement, params in _index_statements(_dialect(db), _entry(call, client, transcript)):
+        await db.execute(statement, params)
+
+
+async def search_transcripts(db, query: str, user_id: int, client: str,
+                             limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    """Calls of a user/client whose transcript matches `query`, best match first."""
+    params = {"user_id": user_id, "client": client.lower(), "limit": limit, "offset": offset}
+    if _dialect(db) == "postgresql":
+        rows = (await db.execute(POSTGRES_SEARCH, {**params, "query": query})).mappings().all()
+    else:
+        expression = fts5_query(query)
+        if not expression:
+            # Nothing but quotes: MATCH '' is a syntax error, and there is no term to find
+            return []
+        rows = (await db.execute(SQLITE_SEARCH, {**params, "query": expression})).mappings().all()
+    results = []
+    for row in rows:
+        started_at = row["call_started_at"]
+        if isinstance(started_at, str):
+            started_at = datetime.fromisoformat(started_at)
+        results.append({
+            "call_id": row["call_id"],
+            "name": row["name"],
+            "call_started_at": started_at,
+            "score": round(float(row["score"]), 4),
+            "snippet": highlight(row["snippet"]),
+        })
+    return results
+
+
+def backfill(engine: Engine, batch_size: int = 500) -> int:
+    """Index the stored transcripts of every ended call; returns the number indexed."""
+    Session = sessionmaker(bind=engine)
+    indexed, last_id = 0, 0
+    with Session() as db:
+        while True:
+            rows = db.execute(
+                select(
+                    models.Call.id, models.Call.call_id, models.Call.user_id, models.Call.name,
+                    models.Call.call_started_at, models.Call.call_transcription, models.Model.client_name,
+                )
+                .join(models.Model, models.Model.model_id == models.Call.model_id)
+                .where(
+                    models.Call.id > last_id,
+                    or_(models.Call.call_ended_at.isnot(None), models.Call.call_status == "ended"),
+                )
+                .order_by(models.Call.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                transcript = row.call_transcription
+                # Calls whose transcript was never fetched still hold the transcript URL
+                if not transcript or transcript.startswith("http"):
+                    continue
+                for statement, params in _index_statements(engine.dialect.name, _entry(row, row.client_name or "", transcript)):
+                    db.execute(statement, params)
+                indexed += 1
+            db.commit()
+            last_id = rows[-1].id
+    return indexed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Transcript full-text index")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from database.db_test.db import engine
+    from .migrations import upgrade
+
+    upgrade(engine)
+    print(f"Indexed {backfill(engine, args.batch_size)} transcripts")
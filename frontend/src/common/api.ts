@@ -4,6 +4,26 @@ import { CreateUserRequest, FeedbackRequest, LoginRequest, TriggerCallRequest, D
 // Single base URL for the merged API (running on port 1234)
 axios.defaults.baseURL = `https://lk-backend3.vaaniresearch.com/api`
 
+// After a write the backend returns the end of its read-your-writes window; sending it
+// back keeps our next reads on the primary database, whichever worker serves them
+const READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes-Until"
+let readYourWritesUntil = 0
+
+axios.interceptors.response.use((response) => {
+  const until = parseFloat(response.headers[READ_YOUR_WRITES_HEADER.toLowerCase()])
+  if (!isNaN(until)) {
+    readYourWritesUntil = Math.max(readYourWritesUntil, until)
+  }
+  return response
+})
+
+axios.interceptors.request.use((config) => {
+  if (readYourWritesUntil > Date.now() / 1000) {
+    config.headers.set(READ_YOUR_WRITES_HEADER, readYourWritesUntil.toFixed(3))
+  }
+  return config
+})
+
 const client = "mysyara";
 
 export const CreateUser = (user: CreateUserRequest) => {
@@ -83,4 +103,34 @@ export const getDashboardSummary = (user_id: string) => {
     },
     timeout: 20000
   });
-};
\ No newline at end of file
+};
+// Streams call details as NDJSON: the transcription arrives first, then summary,
+// entity and conversation_eval as each evaluation finishes on the backend.
+export const streamCallDetails = async (
+  user_id: string,
+  conversation_id: string,
+  onEvent: (event: string, data: any) => void
+) => {
+  const response = await fetch(
+    `${axios.defaults.baseURL}/call_details_stream/${client}/${user_id}/${conversation_id}?format=ndjson`
+  );
+  if (!response.ok || !response.body) {
+    throw new Error(`Call details stream failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop() || "";
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const message = JSON.parse(line);
+      onEvent(message.event, message.data);
+    }
+  }
+};
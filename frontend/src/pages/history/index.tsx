@@ -3,7 +3,7 @@ import './index.css'
 import { Column } from 'primereact/column';
 import { Sidebar } from 'primereact/sidebar';
 import { useEffect, useRef, useState } from 'react';
-import { getCallDetails, getCallHistory } from '../../common/api';
+import { getCallHistory, streamCallDetails } from '../../common/api';
 import { Toast } from 'primereact/toast';
 import { useNavigate } from 'react-router-dom';
 import { pagePaths } from '../../common/constants';
@@ -248,30 +248,32 @@ const History: React.FC<HistoryProps> = () => {
                 const user_id = localStorage.getItem("fullName");
                 if (user_id) {
                     setDetailsLoading(true);
-                    const response = await getCallDetails(user_id, conversationId);
-                    
-                    if (response.status <= 299 && response.data) {
-                        // Process conversation eval data
-                        if (response.data.conversation_eval) {
-                            setConversationEval(response.data.conversation_eval);
-                        } else {
-                            setConversationEval(null);
+                    // Render each part as soon as the backend finishes it
+                    await streamCallDetails(user_id, conversationId, (event, data) => {
+                        if (event === "transcription") {
+                            setSideBarData((prev: any) => ({
+                                ...prev,
+                                transcript: data || prev?.transcript
+                            }));
+                        } else if (event === "summary") {
+                            setSideBarData((prev: any) => ({
+                                ...prev,
+                                summary: data || prev?.summary
+                            }));
+                        } else if (event === "entity") {
+                            setSideBarData((prev: any) => ({
+                                ...prev,
+                                entity: data
+                            }));
+                        } else if (event === "conversation_eval") {
+                            setConversationEval(data || null);
+                        } else if (event === "error") {
+                            // The other parts keep streaming; a failed part is left as it was
+                            console.error("Error evaluating call details:", data);
+                        } else if (event === "done") {
+                            setDetailsLoading(false);
                         }
-                        
-                        // Update sidebar data with fresh transcript/summary if available
-                        // setSideBarData(prev => ({
-                        //     ...prev,
-                        //     transcript: response.data.transcription || prev.transcript,
-                        //     summary: response.data.summary || prev.summary
-                        // }));
-                        setSideBarData((prev: any) => ({
-                        ...prev,
-                        transcript: response.data.transcription || prev?.transcript,
-                        summary: response.data.summary || prev?.summary
-                    }));
-                    } else {
-                        setConversationEval(null);
-                    }
+                    });
                 }
             } catch (error) {
                 console.error("Error fetching call details:", error);
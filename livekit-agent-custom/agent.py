@@ -1,7 +1,9 @@
 import asyncio
+import json
 import logging
 from time import perf_counter
 
+import aiohttp
 from livekit import rtc, api
 from livekit.agents import (
     AgentSession,
@@ -25,6 +27,33 @@ from prompts import get_prompt
 logger = logging.getLogger("livekit-agent")
 logger.setLevel(logging.INFO)
 
+def parse_phone_number(metadata):
+    """Job metadata is either the bare phone number or the backend's JSON payload"""
+    if not metadata:
+        return None
+    try:
+        payload = json.loads(metadata)
+    except json.JSONDecodeError:
+        return metadata
+    return payload.get("phone") if isinstance(payload, dict) else metadata
+
+async def report_call_outcome(config: AgentConfig, room_name: str, outcome: str, detail: str = None):
+    """Tell the backend how the dial ended so unanswered calls can be retried"""
+    if not config.backend_url:
+        return
+    headers = {"X-Agent-Token": config.agent_callback_token} if config.agent_callback_token else {}
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as http:
+            async with http.post(
+                f"{config.backend_url.rstrip('/')}/api/calls/{room_name}/outcome",
+                json={"outcome": outcome, "detail": detail},
+                headers=headers,
+            ) as response:
+                if response.status >= 400:
+                    logger.warning(f"Outcome report for {room_name} failed: {response.status}")
+    except Exception as e:
+        logger.warning(f"Could not report outcome for {room_name}: {e}")
+
 async def entrypoint(ctx: JobContext):
     """
     Main entrypoint for the LiveKit agent
@@ -32,7 +61,7 @@ async def entrypoint(ctx: JobContext):
     # Load configuration
     config = AgentConfig()
     
-    phone_number = ctx.job.metadata if ctx.job.metadata else None
+    phone_number = parse_phone_number(ctx.job.metadata)
     logger.info(f"🚀 Agent connecting to room {ctx.room.name} to dial {phone_number}")
 
     await ctx.connect()
@@ -55,22 +84,37 @@ async def entrypoint(ctx: JobContext):
         participant = await ctx.wait_for_participant(identity=participant_name)
 
         start_time = perf_counter()
-        while perf_counter() - start_time < 30:  # 30 second timeout
+        while perf_counter() - start_time < config.ring_timeout:
             call_status = participant.attributes.get("sip.callStatus")
             
             if call_status == "active":
                 logger.info("📞 Call answered by user")
+                await report_call_outcome(config, ctx.room.name, "answered")
                 break
             elif participant.disconnect_reason == rtc.DisconnectReason.USER_REJECTED:
                 logger.info("❌ User rejected the call")
+                await report_call_outcome(config, ctx.room.name, "rejected")
                 await ctx.shutdown()
                 return
             elif participant.disconnect_reason == rtc.DisconnectReason.USER_UNAVAILABLE:
                 logger.info("❌ User unavailable")
+                await report_call_outcome(config, ctx.room.name, "unavailable")
                 await ctx.shutdown()
                 return
             
             await asyncio.sleep(0.1)
+        else:
+            logger.info(f"❌ No answer within {config.ring_timeout:.0f}s")
+            await report_call_outcome(config, ctx.room.name, "no_answer", f"ring timeout {config.ring_timeout:.0f}s")
+            try:
+                # Hang up the still-ringing SIP leg
+                await ctx.api.room.remove_participant(
+                    api.RoomParticipantIdentity(room=ctx.room.name, identity=participant_name)
+                )
+            except Exception as e:
+                logger.warning(f"Failed to hang up {participant_name}: {e}")
+            await ctx.shutdown()
+            return
 
     # Initialize custom AI components
     custom_llm = CustomLLM(**config.get_llm_config())
@@ -10,6 +10,11 @@ class AgentConfig:
         # SIP Configuration
         self.outbound_trunk_id = os.getenv("SIP_OUTBOUND_TRUNK_ID")
         self.client_name = os.getenv("CLIENT_NAME", "default_client")
+        self.ring_timeout = float(os.getenv("SIP_RING_TIMEOUT_SECONDS", "30"))
+        
+        # Backend callback for dial outcomes (retry scheduling)
+        self.backend_url = os.getenv("BACKEND_URL")
+        self.agent_callback_token = os.getenv("AGENT_CALLBACK_TOKEN")
         
         # LLM Configuration
         self.llm_model = os.getenv("LLM_MODEL", "gpt-4o")